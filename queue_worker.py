@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+# Run simulation jobs that reproduce.py publishes to a shared work queue
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from argparse import ArgumentParser
+from threading import Event
+from utils.work_queue import serve
+from utils import default_worker_count
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description="Run jobs from a work queue (cf. reproduce.py --queue) "
+                    "until interrupted. Start this script in a copy of the "
+                    "repository on each machine.")
+    parser.add_argument(
+        "queue",
+        help="queue directory, shared with the machine that runs "
+             "reproduce.py (e.g., via NFS)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=default_worker_count(),
+        help="number of jobs to run in parallel "
+             "[default: number of CPU cores]")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be a positive integer")
+
+    stop = Event()
+    try:
+        serve(args.queue, args.jobs, stop=stop)
+    except KeyboardInterrupt:
+        stop.set()  # leases of running jobs expire and are re-queued
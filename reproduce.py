@@ -3,25 +3,52 @@
 # Reproduce tables and figures in the submitted manuscript
 # Copyright (C) 2022  Konstantin Emil Thiel
 
-from subprocess import Popen, PIPE, run
-from os import makedirs, mkdir
-from os.path import join, exists, dirname, basename, splitext
+from argparse import ArgumentParser, ArgumentTypeError
+from subprocess import PIPE, run
+from sys import exit
+from os import close, makedirs, remove, sysconf
+from os.path import join, exists, basename, splitext
+from glob import glob
 from shutil import rmtree
+from io import StringIO
+from tempfile import mkstemp
 from pandas import read_csv
 from utils import prepare_power_table_segment, write_power_table
 from utils import prepare_alpha_error_table, write_alpha_error_table
-from utils import write_wins_table, write_pvalue_table
-from typing import Iterable, List, Dict
-
-# simulation program
-R_PROGRAM = ["Rscript", "./ebstatmax/diacerein.R"]
+from utils import write_wins_table, write_pvalue_table, render_tables
+from utils import SimulationJob, JobScheduler, default_worker_count
+from utils import ENGINE_R, ENGINE_NUMPY
+from utils import ResultCache, RunManifest, WorkerPool, ProgressMonitor
+from utils import profile_report, ResultsStore, RuntimeHistory, WorkQueue
+from typing import Iterable, List, Dict, Optional, Set, Union
+
+# auxiliary R scripts
 R_WINS_TABLE_SCRIPT = ["Rscript", "./r-script/wins_table.R"]
 R_PVALUE_TABLE_SCRIPT = ["Rscript", "./r-script/p_values_table.R"]
 R_BOXPLOT_SCRIPT = ["Rscript", "./r-script/boxplot.R"]
 
+# sources that tables and figures are built from (besides raw output)
+SIMUTILS_SOURCES = ["./ebstatmax/simUtils/R", "./ebstatmax/simUtils/data"]
+TABLE_WRITER_SOURCES = [
+    "./utils/write_latex.py",
+    "./utils/prepare_tables.py",
+    "./utils/results_store.py"
+]
+BOXPLOT_DATA = "./ebstatmax/data/Diacerein_study-setup.txt"
+TABLE_NUMBERS = range(1, 19)
+
 # output directory structure
 DIR_RAW_OUTPUT = "raw-output"
 DIR_RESULTS = "results"
+DIR_CACHE = "simulation-cache"
+DEFAULT_CACHE_SIZE = 1024  # megabytes
+RUNTIME_HISTORY = join(DIR_CACHE, "runtime-history.jsonl")  # kept on reruns
+MANIFEST = join(DIR_RAW_OUTPUT, "manifest.jsonl")
+TELEMETRY = join(DIR_RAW_OUTPUT, "telemetry.jsonl")
+PROFILE_REPORT = join(DIR_RAW_OUTPUT, "profile-report.md")
+BOXPLOT_FILES = [join(DIR_RESULTS, "figure-3_pain.pdf"),
+                 join(DIR_RESULTS, "figure-3_pruritus.pdf")]
+RESULTS_STORE = join(DIR_RAW_OUTPUT, "results.sqlite")
 SUBDIR_PAIN = "pain"
 SUBDIR_PRURITUS = "pruritus"
 SUBDIR_SCENARIO_1 = "scenario_1"
@@ -76,37 +103,31 @@ ALPHA_ERROR_SIMULATIONS = {
 DIACEREIN_80_MATCHED = "./Diacerein_80-matched.txt"
 
 
+def table_file(number: int) -> str:
+    return join(DIR_RESULTS, "table_" + str(number) + ".tex")
+
+
 def perform_simulations(
+    scheduler: JobScheduler,
     method: str,
     simulation_settings: Dict[str, str],
     output_dir: str,
-    extra_args="") -> List[str]:
+    extra_args="",
+    engine=ENGINE_R) -> List[str]:
 
+    if method == "nparld":  # the NumPy engine implements GPC only
+        engine = ENGINE_R
     outfiles = []
     for options in simulation_settings:
         file = simulation_settings[options]
         outfile = join(output_dir, file)
-        outfiles.append(outfile)
-        command = R_PROGRAM + ["-m"] + [method] + options.split()
-        if len(extra_args) > 0:
-            command += extra_args.split()
-        outdir = dirname(outfile)
-        if not exists(outdir) and outdir != "":
-            makedirs(outdir)
-        with open(outfile, "w") as out:
-            with Popen(
-                    command,
-                    stderr=PIPE,
-                    stdout=out,
-                    bufsize=1,  # line-buffered
-                    text=True) as p:
-                print("\n\n  running simulations for", outfile, "...\n")
-                for line in p.stderr:
-                    print("  ## ", line, end='')
+        job = SimulationJob(method, options, extra_args, outfile, engine)
+        outfiles.append(scheduler.submit(job))
     return outfiles
 
 
 def generate_power_table(
+    scheduler: JobScheduler,
     methods: Iterable[str],
     period: str,
     number: int,
@@ -114,11 +135,14 @@ def generate_power_table(
     run_simulations=True,
     one_sided=False,
     baseline_adjustion=False,
-    extra_dataset=None) -> None:
+    extra_dataset=None,
+    store: Optional[ResultsStore] = None,
+    engine=ENGINE_R) -> None:
 
-    table_segments = []
+    raw_output_dirs = []
+    outfiles = []
     for method in methods:
-        # run simulations
+        # schedule simulations
         extra_args = ""
         subdir = method
         if extra_dataset:
@@ -131,24 +155,38 @@ def generate_power_table(
             extra_args += " -r"
             subdir += "__baseline_adjusted"
         raw_output_dir = join(DIR_RAW_OUTPUT, subdir)
+        raw_output_dirs.append(raw_output_dir)
         if run_simulations:
-            perform_simulations(
-                method, POWER_SIMULATIONS, raw_output_dir, extra_args)
-        # build and write table
-        df = prepare_power_table_segment(
-            raw_output_dir, POWER_TABLE_FILE_COLUMNS, period)
-        table_segments.append(df)
-    # write table to disc
-    write_power_table(table_segments, DIR_RESULTS, number, caption)
+            outfiles += perform_simulations(
+                scheduler, method, POWER_SIMULATIONS, raw_output_dir,
+                extra_args, engine)
+        else:
+            outfiles += [join(raw_output_dir, file)
+                         for file in POWER_SIMULATIONS.values()]
+
+    def build_table() -> None:
+        table_segments = []
+        for raw_output_dir in raw_output_dirs:
+            df = prepare_power_table_segment(
+                raw_output_dir, POWER_TABLE_FILE_COLUMNS, period, store)
+            table_segments.append(df)
+        write_power_table(table_segments, DIR_RESULTS, number, caption)
+
+    # build and write table once all simulations are done
+    scheduler.add_task("Table " + str(number), build_table, outfiles,
+                       [table_file(number)], TABLE_WRITER_SOURCES)
 
 
 def generate_alpha_error_table(
+    scheduler: JobScheduler,
     number: int,
     caption: str,
     baseline_adjustion=False,
     extra_dataset=None,
     methods=None,
-    add_one_sided_gpc=True) -> None:
+    add_one_sided_gpc=True,
+    store: Optional[ResultsStore] = None,
+    engine=ENGINE_R) -> None:
 
     if methods is None:
         methods = [
@@ -179,7 +217,8 @@ def generate_alpha_error_table(
         if method == "nparld":
             output_dir = join(DIR_RAW_OUTPUT, subdir)
             outfiles = perform_simulations(
-                method, ALPHA_ERROR_SIMULATIONS, output_dir, extra_args)
+                scheduler, method, ALPHA_ERROR_SIMULATIONS, output_dir,
+                extra_args)
             raw_file_rows.extend([outfiles] * 2)
             rname = "nparLD two-sided Period "
             rownames.extend([rname + "1", rname + "2"])
@@ -189,102 +228,313 @@ def generate_alpha_error_table(
             if add_one_sided_gpc:
                 one_sided_output_dir = join(DIR_RAW_OUTPUT, os_subdir)
                 one_sided_outfiles = perform_simulations(
+                    scheduler,
                     method,
                     ALPHA_ERROR_SIMULATIONS, one_sided_output_dir,
-                    extra_args + " -u 1")
+                    extra_args + " -u 1", engine)
                 raw_file_rows.append(one_sided_outfiles)
                 rownames.append(rname + " one-sided")
                 periods.append("combined")
             two_sided_output_dir = join(DIR_RAW_OUTPUT, subdir)
             two_sided_outfiles = perform_simulations(
-                method, ALPHA_ERROR_SIMULATIONS, two_sided_output_dir,
-                extra_args)
+                scheduler, method, ALPHA_ERROR_SIMULATIONS,
+                two_sided_output_dir, extra_args, engine)
             raw_file_rows.append(two_sided_outfiles)
             rownames.append(rname + " two-sided")
             periods.append("combined")
 
-    df = prepare_alpha_error_table(raw_file_rows, periods, rownames)
-    write_alpha_error_table(df, DIR_RESULTS, number, caption)
+    def build_table() -> None:
+        df = prepare_alpha_error_table(raw_file_rows, periods, rownames,
+                                       store)
+        write_alpha_error_table(df, DIR_RESULTS, number, caption)
+
+    # build and write table once all simulations are done
+    dependencies = [file for row in raw_file_rows for file in row]
+    scheduler.add_task("Table " + str(number), build_table, dependencies,
+                       [table_file(number)], TABLE_WRITER_SOURCES)
+
+
+def read_r_script_output(
+    command: List[str],
+    pool: Optional[Union[WorkerPool, WorkQueue]] = None) -> StringIO:
+
+    if pool is None:
+        p = run(command, stdout=PIPE, stderr=PIPE, text=True)
+        if p.returncode != 0:
+            raise RuntimeError("R script {} failed: {}".format(
+                basename(command[1]), p.stderr.strip()))
+        return StringIO(p.stdout)
+    handle, outfile = mkstemp(suffix=".csv")
+    close(handle)
+    try:
+        if not pool.run_command(command, outfile):
+            raise RuntimeError("R script {} failed".format(
+                basename(command[1])))
+        with open(outfile, "r") as f:
+            return StringIO(f.read())
+    finally:
+        remove(outfile)
 
 
 def generate_wins_table(
+    scheduler: JobScheduler,
     number: int,
-    caption: str) -> None:
+    caption: str,
+    pool: Optional[Union[WorkerPool, WorkQueue]] = None) -> None:
 
-    pruritus_cmd = R_WINS_TABLE_SCRIPT + ["Pruritus"]
-    pruritus_proc = Popen(pruritus_cmd, stderr=PIPE, stdout=PIPE, text=True)
-    pruritus_df = read_csv(
-        pruritus_proc.stdout, header=0, index_col=0, dtype=str)
-    pain_cmd = R_WINS_TABLE_SCRIPT + ["Pain"]
-    pain_proc = Popen(pain_cmd, stderr=PIPE, stdout=PIPE, text=True)
-    pain_df = read_csv(pain_proc.stdout, header=0, index_col=0, dtype=str)
-    write_wins_table(pruritus_df, pain_df, DIR_RESULTS, number, caption)
+    def build_table() -> None:
+        pruritus_cmd = R_WINS_TABLE_SCRIPT + ["Pruritus"]
+        pruritus_df = read_csv(read_r_script_output(pruritus_cmd, pool),
+                               header=0, index_col=0, dtype=str)
+        pain_cmd = R_WINS_TABLE_SCRIPT + ["Pain"]
+        pain_df = read_csv(read_r_script_output(pain_cmd, pool),
+                           header=0, index_col=0, dtype=str)
+        write_wins_table(pruritus_df, pain_df, DIR_RESULTS, number, caption)
+
+    sources = [R_WINS_TABLE_SCRIPT[1]] + SIMUTILS_SOURCES + \
+        TABLE_WRITER_SOURCES
+    scheduler.add_task("Table " + str(number), build_table, [],
+                       [table_file(number)], sources)
 
 
 def generate_pvalue_table(
+    scheduler: JobScheduler,
     method: str,  # either "gpc" or "nparld"
     number: int,
-    caption: str) -> None:
+    caption: str,
+    pool: Optional[Union[WorkerPool, WorkQueue]] = None) -> None:
+
+    def build_table() -> None:
+        pruritus_cmd = R_PVALUE_TABLE_SCRIPT + [method, "Pruritus"]
+        pruritus_df = read_csv(read_r_script_output(pruritus_cmd, pool),
+                               header=0, index_col=0, dtype=str)
+        pain_cmd = R_PVALUE_TABLE_SCRIPT + [method, "Pain"]
+        pain_df = read_csv(read_r_script_output(pain_cmd, pool),
+                           header=0, index_col=0, dtype=str)
+        write_pvalue_table(pruritus_df, pain_df, DIR_RESULTS, number,
+                           caption)
+
+    sources = [R_PVALUE_TABLE_SCRIPT[1]] + SIMUTILS_SOURCES + \
+        TABLE_WRITER_SOURCES
+    scheduler.add_task("Table " + str(number), build_table, [],
+                       [table_file(number)], sources)
 
-    pruritus_cmd = R_PVALUE_TABLE_SCRIPT + [method, "Pruritus"]
-    pruritus_proc = Popen(pruritus_cmd, stderr=PIPE, stdout=PIPE, text=True)
-    pruritus_df = read_csv(
-        pruritus_proc.stdout, header=0, index_col=0, dtype=str)
-    pain_cmd = R_PVALUE_TABLE_SCRIPT + [method, "Pain"]
-    pain_proc = Popen(pain_cmd, stderr=PIPE, stdout=PIPE, text=True)
-    pain_df = read_csv(pain_proc.stdout, header=0, index_col=0, dtype=str)
-    write_pvalue_table(pruritus_df, pain_df, DIR_RESULTS, number, caption)
+
+def physical_memory() -> Optional[float]:
+    """Physical memory in megabytes (if it can be determined)."""
+    try:
+        return sysconf("SC_PAGE_SIZE") * sysconf("SC_PHYS_PAGES") / 1024**2
+    except (ValueError, OSError):
+        return None
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
 
 
 def draw_boxplot() -> None:
     p = run(R_BOXPLOT_SCRIPT, capture_output=True, text=True)
     if p.returncode != 0:
         print("could not create Boxplot. The R-stderr reads:", p.stderr)
-    
+
+
+def parse_tables(value: str) -> Set[int]:
+    try:
+        numbers = {int(number) for number in value.split(",")}
+    except ValueError:
+        raise ArgumentTypeError("expected comma-separated table numbers")
+    unknown = numbers - set(TABLE_NUMBERS)
+    if unknown:
+        raise ArgumentTypeError("unknown tables: " + ", ".join(
+            str(number) for number in sorted(unknown)))
+    return numbers
+
 
 if __name__ == "__main__":
 
-    if exists(DIR_RESULTS):
-        rmtree(DIR_RESULTS)
-    if exists(DIR_RAW_OUTPUT):
-        rmtree(DIR_RAW_OUTPUT)
-    
-    mkdir(DIR_RESULTS)
-    mkdir(DIR_RAW_OUTPUT)
+    parser = ArgumentParser(description="Reproduce all tables and figures.")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=default_worker_count(),
+        help="number of simulations to run in parallel "
+             "[default: number of CPU cores]")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="rerun all simulations, even if cached results exist")
+    parser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+        help="maximum size of the simulation cache in megabytes "
+             "[default: %(default)s]")
+    parser.add_argument(
+        "--shards", type=int, default=1,
+        help="split each simulation into this many shards with independent "
+             "random number streams (results differ from the unsharded "
+             "simulation) [default: %(default)s]")
+    parser.add_argument(
+        "--save-p-values", action="store_true",
+        help="save the p-values of all runs next to the raw output "
+             "(float32 .npy files)")
+    parser.add_argument(
+        "--batch-size", type=int, default=1,
+        help="number of permutation runs that are evaluated together "
+             "(does not change the results) [default: %(default)s]")
+    parser.add_argument(
+        "--persistent-workers", action="store_true",
+        help="run R scripts on a pool of long-lived R processes instead of "
+             "starting Rscript for each of them")
+    parser.add_argument(
+        "--queue", metavar="DIR",
+        help="publish simulations and R scripts to a work queue in this "
+             "directory instead of running them locally; workers on other "
+             "machines share it and run queue_worker.py (--jobs is then the "
+             "number of jobs in the queue at a time)")
+    parser.add_argument(
+        "--fuse", action="store_true",
+        help="run simulations that differ in method and side only as a "
+             "single simulation (does not change the results)")
+    parser.add_argument(
+        "--combined-tables", action="store_true",
+        help="additionally compile all tables into a single document "
+             "(results/tables.pdf)")
+    parser.add_argument(
+        "--no-progress", action="store_true",
+        help="do not show the progress of running simulations (and do not "
+             "write raw-output/telemetry.jsonl)")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="profile the stages of all simulations (bypasses the cache) "
+             "and write a report of hot spots per method to "
+             "raw-output/profile-report.md")
+    parser.add_argument(
+        "--memory-limit", type=float, default=physical_memory(),
+        help="only start simulations while their predicted peak memory (from "
+             "previous runs) fits into this many megabytes in total "
+             "[default: physical memory]")
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="only print the predicted time until all simulations have "
+             "finished on --jobs workers (from the runtimes of previous "
+             "runs), without running or deleting anything")
+    parser.add_argument(
+        "--engine", choices=[ENGINE_R, ENGINE_NUMPY], default=ENGINE_R,
+        help="simulate the GPC methods with diacerein.R (r) or in-process "
+             "with NumPy (numpy, cf. utils/gpc_engine.py); results agree "
+             "statistically, not exactly [default: %(default)s]")
+    parser.add_argument(
+        "--cross-check", action="store_true",
+        help="with --engine numpy, additionally run all GPC simulations "
+             "with R and test whether the rejection rates agree")
+    parser.add_argument(
+        "--per-parameter", action="store_true",
+        help="run one simulation per parameter setting of an effect, each "
+             "with its own random seed, and merge their outputs (results "
+             "differ from the published ones, but settings are simulated "
+             "and cached independently)")
+    parser.add_argument(
+        "--tables", type=parse_tables,
+        help="only build these tables (comma-separated numbers, e.g. 2,7) "
+             "and the simulations they depend on [default: all tables and "
+             "figures]")
+    parser.add_argument(
+        "--clean", action="store_true",
+        help="delete the previous raw output and tables first (by default, "
+             "only missing or stale simulations and tables are rebuilt)")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be a positive integer")
+    if args.shards < 1:
+        parser.error("--shards must be a positive integer")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be a positive integer")
+
+    if args.memory_limit is not None and args.memory_limit <= 0:
+        parser.error("--memory-limit must be positive")
+    if args.queue is not None and args.persistent_workers:
+        parser.error("--queue and --persistent-workers are exclusive")
+    if args.cross_check and args.engine != ENGINE_NUMPY:
+        parser.error("--cross-check requires --engine numpy")
+    if args.queue is not None:
+        args.memory_limit = None  # the memory of other machines is unknown
+
+    if args.clean and not args.plan:
+        for tex_file in glob(join(DIR_RESULTS, "table_*.tex")):
+            remove(tex_file)
+        if exists(DIR_RAW_OUTPUT):
+            rmtree(DIR_RAW_OUTPUT)
+
+    # a dry run (--plan) reads the records of previous runs (if any) but
+    # creates no files or directories
+    if not args.plan:
+        makedirs(DIR_RESULTS, exist_ok=True)
+        makedirs(DIR_RAW_OUTPUT, exist_ok=True)
+
+    cache = None
+    if not args.no_cache and (not args.plan or exists(DIR_CACHE)):
+        cache = ResultCache(DIR_CACHE, args.cache_size * 1024**2)
+    manifest = None
+    if not args.plan or exists(MANIFEST):
+        manifest = RunManifest(MANIFEST)
+    history = None
+    if not args.plan or exists(RUNTIME_HISTORY):
+        history = RuntimeHistory(RUNTIME_HISTORY)
+    pool = None
+    if args.persistent_workers and not args.plan:
+        pool = WorkerPool(args.jobs)
+    if args.queue is not None and not args.plan:
+        pool = WorkQueue(args.queue)
+    monitor = None
+    if not args.no_progress and not args.plan:
+        monitor = ProgressMonitor(TELEMETRY)
+    scheduler = JobScheduler(cache, manifest, not args.clean, args.shards,
+                             args.save_p_values, args.batch_size, pool,
+                             args.fuse, monitor, args.profile, history,
+                             args.memory_limit, args.cross_check,
+                             args.per_parameter)
+    store = None
+    if not args.plan:
+        store = ResultsStore(RESULTS_STORE)
+
+    def wanted(number: int) -> bool:
+        return args.tables is None or number in args.tables
 
     ############################
     ####   Fig. 3 Boxplot   ####
     ############################
 
-    print("Creating boxplot (Figure 3).")
+    if args.tables is None:
+        print("Scheduling boxplot (Figure 3).")
+
+        scheduler.add_task("Figure 3", draw_boxplot, [], BOXPLOT_FILES,
+                           [R_BOXPLOT_SCRIPT[1], BOXPLOT_DATA])
 
-    draw_boxplot()
-    
 
     ############################
     ####  Test Statistics   ####
     ############################
 
-    print("Creating test statistics tables (Table 5, 6).")
+    print("Scheduling test statistics tables (Table 5, 6).")
 
     caption_5 = \
         r"Resulting interaction effect of time and group for the ordinal " \
         r"outcome ``pruritus'' and ``pain'' in the original dataset using " \
         r"nparLD with the ANOVA-type statistics."
-    generate_pvalue_table("nparld", 5, caption_5)
+    if wanted(5):
+        generate_pvalue_table(scheduler, "nparld", 5, caption_5, pool)
 
     caption_6 = \
         r"Resulting two-sided $p$-value and test statistic for the GPC " \
         r"variants applied to the original dataset for the ordinal outcome " \
         r"``pruritus'' and ``pain''."
-    generate_pvalue_table("gpc", 6, caption_6)
+    if wanted(6):
+        generate_pvalue_table(scheduler, "gpc", 6, caption_6, pool)
 
 
     ############################
     ####  Wins/Ties/Losses  ####
     ############################
 
-    print("Creating GPC wins/ties/losses table (Table 13).")
+    print("Scheduling GPC wins/ties/losses table (Table 13).")
 
     caption_13 = \
         r"Net benefit (95\% CI) and $p$-value (one-sided) for the GPC " \
@@ -292,14 +542,15 @@ if __name__ == "__main__":
         r"``pruritus'' and ``pain'', with the following prioritization (in " \
         r"descending order): time point W4=post treatment, FU=follow up, " \
         r"W2=2 weeks, W0=baseline."
-    generate_wins_table(13, caption_13)
+    if wanted(13):
+        generate_wins_table(scheduler, 13, caption_13, pool)
 
 
     ########################
     ####  Type I Error  ####
     ########################
 
-    print("Creating type I error tables (Table 8, 9, 14).")
+    print("Scheduling type I error tables (Table 8, 9, 14).")
 
     methods_8 = [
         "univariate-unmatched-gpc",
@@ -310,16 +561,20 @@ if __name__ == "__main__":
         r" and ``pain'' based on 5000 permutation runs using using " \
         r"the two-sided unmatched GPC variants when restricted to data from " \
         r"subjects who participated in both treatment periods (N=80)."
-    generate_alpha_error_table(8, caption_8, methods=methods_8,
-                               extra_dataset=DIACEREIN_80_MATCHED,
-                               add_one_sided_gpc=False)
+    if wanted(8):
+        generate_alpha_error_table(scheduler, 8, caption_8, methods=methods_8,
+                                   extra_dataset=DIACEREIN_80_MATCHED,
+                                   add_one_sided_gpc=False, store=store,
+                                   engine=args.engine)
     
     caption_9 = \
         r"Type I error simulation result for the ordinal outcome ``pruritus''" \
         r" and ``pain'' based on 5000 permutation runs using matched and " \
         r"unmatched univariate/prioritized/non-prioritized GPC (one-sided " \
         r"and two-sided) and nparLD split into time period 1 and 2 (two-sided)."
-    generate_alpha_error_table(9, caption_9)
+    if wanted(9):
+        generate_alpha_error_table(scheduler, 9, caption_9, store=store,
+                                   engine=args.engine)
 
     caption_14 = \
         r"\textit{Change from baseline approach:} Type I error simulation " \
@@ -327,14 +582,17 @@ if __name__ == "__main__":
         r"on 5000 permutation runs using matched and unmatched " \
         r"univariate/prioritized/non-prioritized GPC (one-sided and " \
         r"two-sided) and nparLD split into time period 1 and 2 (two-sided)."
-    generate_alpha_error_table(14, caption_14, baseline_adjustion=True)
+    if wanted(14):
+        generate_alpha_error_table(scheduler, 14, caption_14,
+                                   baseline_adjustion=True, store=store,
+                                   engine=args.engine)
 
 
     ########################
     ####  nparLD Power  ####
     ########################
 
-    print("Creating nparLD power tables (Table 1, 10, 15).")
+    print("Scheduling nparLD power tables (Table 1, 10, 15).")
 
     methods_1 = ["nparld"]
     caption_1 = \
@@ -342,7 +600,9 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the method nparLD."
-    generate_power_table(methods_1, "period_1", 1, caption_1)
+    if wanted(1):
+        generate_power_table(scheduler, methods_1, "period_1", 1, caption_1,
+                             store=store)
 
     methods_10 = ["nparld"]
     caption_10 = \
@@ -350,8 +610,9 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"nparLD for period 2 data."
-    generate_power_table(methods_10, "period_2", 10, caption_10,
-                         run_simulations=False)
+    if wanted(10):
+        generate_power_table(scheduler, methods_10, "period_2", 10, caption_10,
+                             store=store)
 
     methods_15 = ["nparld"]
     caption_15 = \
@@ -360,15 +621,16 @@ if __name__ == "__main__":
         r"log-normal effects and normal effects (with $\sigma_{log}$ and " \
         r"$\sigma_{norm} =1$) and scenarios 1 and 2 using nparLD for " \
         r"period 1 data."
-    generate_power_table(methods_15, "period_1", 15, caption_15,
-                         baseline_adjustion=True)
+    if wanted(15):
+        generate_power_table(scheduler, methods_15, "period_1", 15, caption_15,
+                             baseline_adjustion=True, store=store)
 
 
     ########################
     #####  GPC Power  ######
     ########################
 
-    print("Creating GPC power tables (Table 2, 3, 4, 7, 11, 12, 16, 17, 18).")
+    print("Scheduling GPC power tables (Table 2, 3, 4, 7, 11, 12, 16, 17, 18).")
 
     methods_2 = ["univariate-matched-gpc", "univariate-unmatched-gpc"]
     caption_2 = \
@@ -376,7 +638,10 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the two-sided univariate matched and unmatched GPC method."
-    generate_power_table(methods_2, "combined", 2, caption_2)
+    if wanted(2):
+        generate_power_table(scheduler, methods_2, "combined", 2, caption_2,
+                             store=store,
+                             engine=args.engine)
 
     methods_3 = ["non-prioritized-unmatched-gpc"]
     caption_3 = \
@@ -384,7 +649,10 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the two-sided non-prioritized unmatched GPC method."
-    generate_power_table(methods_3, "combined", 3, caption_3)
+    if wanted(3):
+        generate_power_table(scheduler, methods_3, "combined", 3, caption_3,
+                             store=store,
+                             engine=args.engine)
 
     methods_4 = ["prioritized-matched-gpc", "prioritized-unmatched-gpc"]
     caption_4 = \
@@ -392,7 +660,10 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the two-sided prioritized matched and unmatched GPC method."
-    generate_power_table(methods_4, "combined", 4, caption_4)
+    if wanted(4):
+        generate_power_table(scheduler, methods_4, "combined", 4, caption_4,
+                             store=store,
+                             engine=args.engine)
 
     methods_7 = [
         "univariate-unmatched-gpc",
@@ -404,8 +675,10 @@ if __name__ == "__main__":
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the two-sided unmatched GPC variants when restricted to data from " \
         r"subjects who participated in both treatment periods (N=80)."
-    generate_power_table(methods_7, "combined", 7, caption_7,
-                         extra_dataset=DIACEREIN_80_MATCHED)
+    if wanted(7):
+        generate_power_table(scheduler, methods_7, "combined", 7, caption_7,
+                             extra_dataset=DIACEREIN_80_MATCHED, store=store,
+                             engine=args.engine)
 
     methods_11 = ["non-prioritized-unmatched-gpc"]
     caption_11 = \
@@ -413,7 +686,10 @@ if __name__ == "__main__":
         r"``pain'' with varying log-normal effects and normal effects (with " \
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the one-sided non-prioritized unmatched GPC method."
-    generate_power_table(methods_11, "combined", 11, caption_11, one_sided=True)
+    if wanted(11):
+        generate_power_table(scheduler, methods_11, "combined", 11, caption_11,
+                             one_sided=True, store=store,
+                             engine=args.engine)
 
     methods_12 = [
         "univariate-matched-gpc",
@@ -426,7 +702,10 @@ if __name__ == "__main__":
         r"$\sigma_{log}$ and $\sigma_{norm} =1$) and scenarios 1 and 2 using " \
         r"the one-sided univariate/prioritized matched and unmatched GPC " \
         r"method."
-    generate_power_table(methods_12, "combined", 12, caption_12, one_sided=True)
+    if wanted(12):
+        generate_power_table(scheduler, methods_12, "combined", 12, caption_12,
+                             one_sided=True, store=store,
+                             engine=args.engine)
 
     methods_16 = ["non-prioritized-unmatched-gpc"]
     caption_16 = \
@@ -435,8 +714,10 @@ if __name__ == "__main__":
         r"log-normal effects and normal effects (with $\sigma_{log}$ and " \
         r"$\sigma_{norm} =1$) and scenarios 1 and 2 using the two-sided " \
         r"non-prioritized unmatched GPC method."
-    generate_power_table(methods_16, "combined", 16, caption_16,
-                         baseline_adjustion=True)
+    if wanted(16):
+        generate_power_table(scheduler, methods_16, "combined", 16, caption_16,
+                             baseline_adjustion=True, store=store,
+                             engine=args.engine)
 
     methods_17 = [
         "univariate-matched-gpc",
@@ -447,8 +728,10 @@ if __name__ == "__main__":
         r"log-normal effects and normal effects (with $\sigma_{log}$ and " \
         r"$\sigma_{norm} =1$) and scenarios 1 and 2 using the two-sided " \
         r"univariate matched and unmatched GPC method."
-    generate_power_table(methods_17, "combined", 17, caption_17,
-                         baseline_adjustion=True)
+    if wanted(17):
+        generate_power_table(scheduler, methods_17, "combined", 17, caption_17,
+                             baseline_adjustion=True, store=store,
+                             engine=args.engine)
 
     methods_18 = [
         "prioritized-matched-gpc",
@@ -459,5 +742,44 @@ if __name__ == "__main__":
         r"log-normal effects and normal effects (with $\sigma_{log}$ and " \
         r"$\sigma_{norm} =1$) and scenarios 1 and 2 using the two-sided " \
         r"prioritized matched and unmatched GPC method."
-    generate_power_table(methods_18, "combined", 18, caption_18,
-                         baseline_adjustion=True)
+    if wanted(18):
+        generate_power_table(scheduler, methods_18, "combined", 18, caption_18,
+                             baseline_adjustion=True, store=store,
+                             engine=args.engine)
+
+
+    ########################
+    ####  Run Schedule  ####
+    ########################
+
+    if args.plan:
+        plan = scheduler.plan(args.jobs)
+        print("Predicted time for", plan.jobs, "of", len(scheduler.jobs),
+              "simulations on", args.jobs, "workers:",
+              format_duration(plan.makespan))
+        if plan.unknown > 0:
+            print("(no runtime recorded for", plan.unknown, "simulations; "
+                  "assuming the mean runtime)")
+        exit(0)
+
+    print("Running", len(scheduler.jobs), "simulations on",
+          args.jobs, "workers.")
+
+    failed_tasks = scheduler.run(args.jobs)
+    store.close()
+    for outfile, disagreements in scheduler.disagreements.items():
+        print("NumPy and R engine disagree for", outfile + ":")
+        for disagreement in disagreements:
+            print("  " + disagreement)
+    if monitor is not None:
+        monitor.close()
+    if pool is not None:
+        pool.close()
+    if args.profile:
+        print(profile_report(DIR_RAW_OUTPUT, PROFILE_REPORT))
+
+    print("Compiling tables.")
+
+    failed_tasks += render_tables(DIR_RESULTS, args.jobs, args.combined_tables)
+    if len(failed_tasks) > 0:
+        print("Could not create:", ", ".join(failed_tasks))
@@ -0,0 +1 @@
+# Copyright (C) 2022  Konstantin Emil Thiel
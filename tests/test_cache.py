@@ -0,0 +1,130 @@
+# tests of the cache for simulation results (../utils/cache.py)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from os import utime
+from os.path import exists, join, samefile
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from unittest.mock import patch
+from utils.cache import ENGINE_NUMPY, ENGINE_R, InputHash, ResultCache
+
+
+def write(filename: str, text: str) -> None:
+    with open(filename, "w") as f:
+        f.write(text)
+
+
+class TestInputHash(TestCase):
+    """Keys depend on the command, the dataset and the engine's sources."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.files = {name: join(self.directory.name, name)
+                      for name in ("dataset", "r", "numpy", "shared")}
+        for filename in self.files.values():
+            write(filename, "1")
+        self.command = ["-m", "univariate-matched-gpc",
+                        "-d", self.files["dataset"]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def keys(self):
+        inputs = InputHash({
+            ENGINE_R: [self.files["r"], self.files["shared"]],
+            ENGINE_NUMPY: [self.files["numpy"], self.files["shared"]]
+        })
+        return (inputs.key(self.command, ENGINE_R),
+                inputs.key(self.command, ENGINE_NUMPY))
+
+    def test_sources_per_engine(self):
+        r_key, numpy_key = self.keys()
+        self.assertNotEqual(r_key, numpy_key)
+        write(self.files["numpy"], "2")
+        self.assertEqual(self.keys()[0], r_key)
+        self.assertNotEqual(self.keys()[1], numpy_key)
+        r_key, numpy_key = self.keys()
+        write(self.files["r"], "2")
+        self.assertNotEqual(self.keys()[0], r_key)
+        self.assertEqual(self.keys()[1], numpy_key)
+
+    def test_shared_sources_and_dataset(self):
+        r_key, numpy_key = self.keys()
+        write(self.files["shared"], "2")
+        self.assertNotEqual(self.keys()[0], r_key)
+        self.assertNotEqual(self.keys()[1], numpy_key)
+        r_key, numpy_key = self.keys()
+        write(self.files["dataset"], "2")
+        self.assertNotEqual(self.keys(), (r_key, numpy_key))
+
+
+class TestResultCache(TestCase):
+    """Entries are linked into place and evicted least recently used."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        # room for two entries of 14 bytes each
+        self.cache = ResultCache(join(self.directory.name, "cache"), 30)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def outfile(self, name: str) -> str:
+        filename = join(self.directory.name, name + ".json")
+        write(filename, '{"runs": 1000}')
+        return filename
+
+    def store(self, key: str, last_used: float) -> str:
+        outfile = self.outfile(key)
+        self.cache.store(key, outfile)
+        utime(self.cache.path(key), (last_used, last_used))
+        return outfile
+
+    def test_lookup(self):
+        outfile = join(self.directory.name, "out.json")
+        self.assertFalse(self.cache.lookup("a", outfile))
+        self.assertFalse(exists(outfile))
+        write(outfile, "{}")  # unfinished
+        self.cache.store("a", outfile)
+        self.assertFalse(self.cache.contains("a"))
+        stored = self.store("a", 1000)
+        self.assertTrue(self.cache.lookup("a", outfile))
+        self.assertTrue(samefile(outfile, stored))
+        self.assertTrue(samefile(outfile, self.cache.path("a")))
+
+    def test_least_recently_used(self):
+        self.store("a", 1000)
+        self.store("b", 2000)
+        self.assertTrue(self.cache.lookup(
+            "a", join(self.directory.name, "out.json")))
+        self.store("c", 3000)
+        self.assertTrue(self.cache.contains("a"))
+        self.assertFalse(self.cache.contains("b"))
+        self.assertTrue(self.cache.contains("c"))
+
+    def test_outfiles_survive_eviction(self):
+        stored = self.store("a", 1000)
+        outfile = join(self.directory.name, "out.json")
+        self.assertTrue(self.cache.lookup("a", outfile))
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.assertFalse(self.cache.contains("a"))
+        for filename in (stored, outfile):
+            with open(filename, "r") as f:
+                self.assertEqual(f.read(), '{"runs": 1000}')
+
+    def test_copy_without_links(self):
+        outfile = join(self.directory.name, "out.json")
+        with patch("utils.cache.link", side_effect=OSError):
+            stored = self.store("a", 1000)
+            self.assertTrue(self.cache.lookup("a", outfile))
+        cached = self.cache.path("a")
+        self.assertFalse(samefile(stored, cached))
+        self.assertFalse(samefile(outfile, cached))
+        for filename in (cached, outfile):
+            with open(filename, "r") as f:
+                self.assertEqual(f.read(), '{"runs": 1000}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# tests of the NumPy port of the GPC simulations (../utils/gpc_engine.py)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from numpy import arange, array, ones, sign, sqrt, zeros
+from numpy.random import default_rng
+from os.path import abspath, dirname, join
+from unittest import TestCase, main
+from utils.gpc_engine import DEFAULT_DATASET, PARAMETERS, SETTINGS
+from utils.gpc_engine import Design, column_ranks, count_wins
+from utils.gpc_engine import gpc_statistic, matched_pair_scores
+from utils.gpc_engine import parameter_argument, score_row_sums, simulate
+from utils.gpc_engine import tie_classes
+from utils.merge_shards import merge_shards
+from utils.prepare_tables import merge_cells
+
+
+DATASET = join(dirname(abspath(__file__)), "..", DEFAULT_DATASET)
+
+
+def score_matrix(x, y):
+    """Pairwise scores of x against y (lower values preferred)."""
+    return sign(y[None, :] - x[:, None])
+
+
+def quiet(line: str) -> None:
+    pass
+
+
+def univariate_design(treated, verum=(), control=()) -> Design:
+    """Design with one testing row per block (block k is row k)."""
+    treated = array(treated, dtype=bool)
+    blocks = arange(len(treated))
+    return Design(values=None, times=None, placebo=~treated, keep=blocks,
+                  block=blocks, treated=treated, time_rows={},
+                  balanced=True, verum=array(verum, dtype=int),
+                  control=array(control, dtype=int))
+
+
+class TestScores(TestCase):
+    """Ranking and scoring helpers agree with pairwise comparisons."""
+
+    def setUp(self):
+        rng = default_rng(1)
+        self.test = rng.integers(0, 11, (4, 30))  # many ties
+        self.control = rng.integers(0, 11, (4, 25))
+        self.values = rng.integers(0, 11, (4, 55))
+
+    def test_column_ranks(self):
+        min_rank, max_rank = column_ranks(self.values)
+        for run, v in enumerate(self.values):
+            self.assertEqual(list(min_rank[run]),
+                             [1 + (v < x).sum() for x in v])
+            self.assertEqual(list(max_rank[run]),
+                             [(v <= x).sum() for x in v])
+
+    def test_count_wins(self):
+        wins, losses = count_wins(self.test, self.control, "lower")
+        higher_wins, higher_losses = count_wins(
+            self.test, self.control, "higher")
+        for run, (t, c) in enumerate(zip(self.test, self.control)):
+            scores = score_matrix(t, c)
+            self.assertEqual(wins[run], (scores > 0).sum())
+            self.assertEqual(losses[run], (scores < 0).sum())
+            self.assertEqual(higher_wins[run], (scores < 0).sum())
+            self.assertEqual(higher_losses[run], (scores > 0).sum())
+
+    def test_score_row_sums(self):
+        lower = score_row_sums(self.values, "lower")
+        higher = score_row_sums(self.values, "higher")
+        for run, v in enumerate(self.values):
+            row_sums = score_matrix(v, v).sum(axis=1)
+            self.assertEqual(list(lower[run]), list(row_sums))
+            self.assertEqual(list(higher[run]), list(-row_sums))
+
+    def test_tie_classes(self):
+        # prioritized comparison: the first non-tied outcome decides
+        rng = default_rng(2)
+        first = rng.integers(0, 3, (3, 40))
+        second = rng.integers(0, 3, (3, 40))
+        classes = tie_classes(tie_classes(0, first), second)
+        for run in range(3):
+            f, s = first[run], second[run]
+            prioritized = sign(f[:, None] - f[None, :])
+            ties = prioritized == 0
+            prioritized[ties] = sign(s[:, None] - s[None, :])[ties]
+            c = classes[run]
+            self.assertTrue(
+                (sign(c[:, None] - c[None, :]) == prioritized).all())
+
+    def test_matched_pair_scores(self):
+        # subject j has verum block 2j and placebo block 2j + 1; the
+        # reference masks full score matrices by pairs decided before
+        rng = default_rng(3)
+        outcomes = [rng.integers(0, 3, (2, 40)) for _ in range(3)]
+        verum = 2 * arange(20)
+        placebo = verum + 1
+        scores = matched_pair_scores([o[:, verum] for o in outcomes],
+                                     [o[:, placebo] for o in outcomes],
+                                     "lower")
+        for run in range(2):
+            decided = zeros((40, 40))
+            for o, s in zip(outcomes, scores):
+                masked = score_matrix(o[run], o[run]) * (1 - abs(decided))
+                self.assertEqual(list(s[run]),
+                                 list(masked[verum, placebo]))
+                decided = decided + masked
+
+
+class TestStatistic(TestCase):
+    """GPC statistics of tiny designs agree with their closed forms."""
+
+    def test_univariate_unmatched(self):
+        # verum (3, 5) vs. placebo (1, 5): 2 wins and 1 loss out of 4 pairs,
+        # i.e., a net benefit of 1/4; the score row sums (-1, 2, -3, 2)
+        # give a variance of 18 / (4 * 4 * 3) = 3/8
+        design = univariate_design([True, True, False, False])
+        z = gpc_statistic(design, array([[3.0, 5.0, 1.0, 5.0]]),
+                          "univariate", "unmatched", best="higher")
+        self.assertAlmostEqual(z[0], sqrt(1 / 6))
+        z = gpc_statistic(design, array([[3.0, 5.0, 1.0, 5.0]]),
+                          "univariate", "unmatched", best="lower")
+        self.assertAlmostEqual(z[0], -sqrt(1 / 6))
+
+    def test_univariate_matched(self):
+        # differences of the pairs (+1, +2, -3): a sign test with 2 wins
+        # and 1 loss, i.e., z = (2 - 1) / sqrt(3)
+        design = univariate_design([True] * 3 + [False] * 3,
+                                   verum=[0, 1, 2], control=[3, 4, 5])
+        z = gpc_statistic(design, array([[2.0, 5.0, 4.0, 1.0, 3.0, 7.0]]),
+                          "univariate", "matched", best="higher")
+        self.assertAlmostEqual(z[0], 1 / sqrt(3))
+
+    def test_no_decided_pairs(self):
+        design = univariate_design([True, False], verum=[0], control=[1])
+        z = gpc_statistic(design, ones((1, 2)), "univariate", "matched")
+        self.assertEqual(z[0], 0.0)
+
+
+class TestOutput(TestCase):
+    """Outputs have the format of diacerein.R and can be merged."""
+
+    def simulate(self, *arguments):
+        return simulate(["-m", "univariate-unmatched-gpc", "-d", DATASET,
+                         "-t", "Pruritus", "-n", "20", *arguments], quiet)
+
+    def test_shards(self):
+        output = self.simulate("-e", "norm")
+        shards = [self.simulate("-e", "norm", "--shard", shard)
+                  for shard in ("2/2", "1/2")]
+        merged = merge_shards(shards)
+        self.assertEqual(list(output), list(SETTINGS) + ["power"])
+        self.assertEqual(set(merged) - set(output), {"shards"})
+        self.assertEqual(list(merged["power"]), list(output["power"]))
+        for parameters, summary in merged["power"].items():
+            self.assertEqual(set(summary), set(output["power"][parameters]))
+            self.assertEqual(summary["rejection_count"]["combined"],
+                             sum(s["power"][parameters]["rejection_count"]
+                                 ["combined"] for s in shards))
+            self.assertEqual(summary["NA_count"]["period_1"], 20)
+
+    def test_alpha_error_shards(self):
+        output = self.simulate("--shard", "1/2")
+        merged = merge_shards([output, self.simulate("--shard", "2/2")])
+        self.assertEqual(merged["runs"], 20)
+        self.assertEqual(merged["alpha_error"]["NA_count"]["period_1"], 20)
+
+    def test_cells(self):
+        output = self.simulate("-e", "lnorm")
+        cells = [self.simulate("-e", "lnorm", "--parameter",
+                               parameter_argument(params))
+                 for params in PARAMETERS["lnorm"]]
+        self.assertNotEqual(cells[0]["cell"]["seed"],
+                            cells[1]["cell"]["seed"])
+        merged = merge_cells(cells)
+        self.assertEqual(list(merged), list(output))
+        self.assertEqual(list(merged["power"]), list(output["power"]))
+        self.assertEqual(self.simulate("-e", "lnorm", "--parameter",
+                                       parameter_argument(
+                                           PARAMETERS["lnorm"][0])),
+                         cells[0])
+
+
+if __name__ == "__main__":
+    main()
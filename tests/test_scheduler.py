@@ -0,0 +1,106 @@
+# tests of the scheduler of simulation jobs (../utils/scheduler.py)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from utils.gpc_engine import PARAMETERS, parameter_argument
+from utils.prepare_tables import cell_filename
+from utils.scheduler import JobScheduler, SimulationJob
+
+
+def write(filename: str) -> None:
+    with open(filename, "w") as f:
+        f.write("{}")
+
+
+def fail() -> None:
+    raise KeyError("missing")
+
+
+class FailingScheduler(JobScheduler):
+    """Scheduler whose jobs raise an exception instead of running."""
+
+    def run_job(self, job: SimulationJob) -> bool:
+        raise OSError("cannot split")
+
+
+class TestCells(TestCase):
+    """Power simulations are split into the settings of the grid."""
+
+    def submit(self, shards=1):
+        scheduler = JobScheduler(shards=shards, per_parameter=True)
+        scheduler.submit(SimulationJob("nparld", "-t Pain -e lnorm", "-n 10",
+                                       "lnorm.json"))
+        scheduler.submit(SimulationJob("nparld", "-t Pain", "-n 10",
+                                       "alpha.json"))
+        return scheduler
+
+    def test_one_job_per_setting(self):
+        scheduler = self.submit()
+        parameters = [parameter_argument(p) for p in PARAMETERS["lnorm"]]
+        cells = [cell_filename("lnorm.json", p) for p in parameters]
+        self.assertEqual(sorted(scheduler.jobs),
+                         sorted(cells + ["alpha.json"]))
+        for cell, parameter in zip(cells, parameters):
+            arguments = scheduler.jobs[cell].arguments()
+            self.assertEqual(
+                arguments[arguments.index("--parameter") + 1], parameter)
+        merge, = scheduler.tasks
+        self.assertEqual(merge.dependencies, cells)
+        self.assertEqual(merge.outputs, ["lnorm.json"])
+
+    def test_grid_extension(self):
+        added = {"meanlog": 0.4, "sdlog": 1}
+        PARAMETERS["lnorm"].append(added)
+        try:
+            scheduler = self.submit()
+        finally:
+            PARAMETERS["lnorm"].remove(added)
+        self.assertIn(cell_filename("lnorm.json", parameter_argument(added)),
+                      scheduler.jobs)
+
+    def test_sharded_cells(self):
+        scheduler = self.submit(shards=2)
+        self.assertEqual(len(scheduler.jobs),
+                         2 * (len(PARAMETERS["lnorm"]) + 1))
+        self.assertEqual(len(scheduler.tasks), len(PARAMETERS["lnorm"]) + 2)
+
+
+class TestFailures(TestCase):
+    """Failing tasks and jobs do not abort the other ones."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return join(self.directory.name, name)
+
+    def test_failing_task(self):
+        scheduler = JobScheduler()
+        scheduler.add_task("failing", fail, [], [self.path("a")])
+        scheduler.add_task("dependent", lambda: write(self.path("b")),
+                           [self.path("a")], [self.path("b")])
+        scheduler.add_task("independent", lambda: write(self.path("c")),
+                           [], [self.path("c")])
+        self.assertEqual(scheduler.run(1), ["failing", "dependent"])
+        self.assertFalse(exists(self.path("b")))
+        self.assertTrue(exists(self.path("c")))
+
+    def test_failing_job(self):
+        scheduler = FailingScheduler()
+        outfile = self.path("alpha.json")
+        scheduler.submit(SimulationJob("nparld", "-t Pain", "-n 10", outfile))
+        scheduler.add_task("table", lambda: write(self.path("table")),
+                           [outfile], [self.path("table")])
+        scheduler.add_task("independent", lambda: write(self.path("c")),
+                           [], [self.path("c")])
+        self.assertEqual(scheduler.run(2), ["table"])
+        self.assertTrue(exists(self.path("c")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# tests of the work queue in a shared directory (../utils/work_queue.py)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from os import listdir
+from os.path import exists, join
+from sys import executable
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import monotonic
+from unittest import TestCase, main
+from unittest.mock import patch
+from utils.work_queue import DIR_DONE, DIR_LEASED, DIR_LOGS, DIR_PENDING
+from utils.work_queue import STATUS_OK, WorkQueue, claim, execute, serve
+
+
+# appends a line to the file given as first argument and prints "done"
+COUNT_RUN = "import sys; open(sys.argv[1], 'a').write('run\\n'); print('done')"
+
+
+class TestWorkQueue(TestCase):
+    """Jobs finish once, also if workers get lost or jobs are withdrawn."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)  # after the workers stop
+        self.queue_dir = join(self.directory.name, "queue")
+        self.counter = join(self.directory.name, "runs")
+        self.queue = WorkQueue(self.queue_dir, lease_timeout=1.0,
+                               poll_interval=0.05)
+        self.command = [executable, "-c", COUNT_RUN, self.counter]
+
+    def runs(self) -> int:
+        if not exists(self.counter):
+            return 0
+        with open(self.counter, "r") as f:
+            return len(f.readlines())
+
+    def files(self, subdir: str) -> list:
+        return listdir(join(self.queue_dir, subdir))
+
+    def assertEmpty(self):
+        for subdir in (DIR_PENDING, DIR_LEASED, DIR_DONE, DIR_LOGS):
+            self.assertEqual(self.files(subdir), [], subdir)
+
+    def serve(self) -> None:
+        """Start two worker threads that heartbeat every 0.1 seconds."""
+        for patcher in (patch("utils.work_queue.HEARTBEAT_INTERVAL", 0.1),
+                        patch("utils.work_queue.print", create=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        stop = Event()
+        workers = Thread(target=serve, args=(self.queue_dir, 2),
+                         kwargs={"poll_interval": 0.05, "stop": stop})
+        workers.start()
+        self.addCleanup(workers.join)
+        self.addCleanup(stop.set)
+
+    def requeue(self, job_id: str) -> None:
+        """Re-queue a lease as the coordinator does after the timeout."""
+        self.queue.lease_timeout = 0.0
+        heartbeat = self.queue.requeue_if_lost(job_id, (None, monotonic()))
+        self.assertEqual(self.files(DIR_PENDING), [])
+        self.queue.requeue_if_lost(job_id, heartbeat)
+        self.assertEqual(self.files(DIR_LEASED), [])
+        self.assertEqual(self.files(DIR_PENDING), [job_id + ".json"])
+
+    def test_run_command(self):
+        self.serve()
+        stdout = join(self.directory.name, "stdout")
+        self.assertTrue(self.queue.run_command(self.command, stdout))
+        with open(stdout, "r") as f:
+            self.assertEqual(f.read(), "done\n")
+        self.assertFalse(self.queue.run_command(
+            [executable, "-c", "raise SystemExit(1)"], stdout))
+        self.assertEqual(self.runs(), 1)
+        self.assertEmpty()
+
+    def test_lost_worker(self):
+        # a worker claims the job and dies without a heartbeat
+        job_id = self.queue.publish(self.command)
+        self.assertEqual(claim(self.queue_dir)["id"], job_id)
+        self.serve()
+        result = self.queue.wait(job_id)
+        self.assertEqual(result["status"], STATUS_OK)
+        self.assertEqual(result["stdout"], "done\n")
+        self.assertEqual(self.runs(), 1)
+        self.queue.discard(job_id)
+        self.assertEmpty()
+
+    def test_duplicate_completion(self):
+        # the lost worker returns after its job has been re-queued and
+        # claimed again: the first result counts, later ones are dropped
+        job_id = self.queue.publish(self.command)
+        lost = claim(self.queue_dir)
+        self.requeue(job_id)
+        second = claim(self.queue_dir)
+        self.assertEqual(second["id"], job_id)
+        execute(self.queue_dir, lost)
+        self.assertEqual(self.files(DIR_DONE), [job_id + ".json"])
+        self.assertEqual(self.queue.wait(job_id)["status"], STATUS_OK)
+        self.queue.discard(job_id)
+        execute(self.queue_dir, second)
+        self.assertEqual(self.runs(), 2)
+        self.assertEmpty()
+
+    def test_close(self):
+        running = self.queue.publish(self.command)
+        self.queue.publish(self.command)
+        spec = claim(self.queue_dir)
+        self.assertEqual(spec["id"], running)
+        self.queue.close()
+        self.assertEqual(self.files(DIR_PENDING), [])
+        self.assertEqual(self.files(DIR_LEASED), [])
+        execute(self.queue_dir, spec)  # finishes after the withdrawal
+        self.assertEqual(self.runs(), 1)
+        self.assertEmpty()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,28 @@
 
 from .prepare_tables import prepare_power_table_segment
 from .prepare_tables import prepare_alpha_error_table
+from .prepare_tables import read_p_values
+from .prepare_tables import summarize_p_values
+from .prepare_tables import prepare_p_value_summary
+from .prepare_tables import merge_cell_files
 from .write_latex import write_power_table
 from .write_latex import write_alpha_error_table
 from .write_latex import write_wins_table
 from .write_latex import write_pvalue_table
+from .write_latex import render_tables
+from .scheduler import SimulationJob
+from .scheduler import JobScheduler
+from .scheduler import default_worker_count
+from .scheduler import ENGINE_R
+from .scheduler import ENGINE_NUMPY
+from .cache import ResultCache
+from .manifest import RunManifest
+from .merge_shards import merge_shards
+from .merge_shards import merge_shard_files
+from .worker_pool import WorkerPool
+from .progress import ProgressMonitor
+from .profile_report import profile_report
+from .results_store import ResultsStore
+from .runtime_history import RuntimeHistory
+from .work_queue import WorkQueue
+from .gpc_engine import cross_check
@@ -0,0 +1,186 @@
+# content-addressed cache for simulation results (../ebstatmax/diacerein.R)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from hashlib import sha256
+from json import load, JSONDecodeError
+from os import link, listdir, makedirs, remove, stat, utime
+from os.path import exists, getsize, isdir, join
+from shutil import copy2
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+
+# simulation engines (diacerein.R and the NumPy port, cf. gpc_engine.py)
+ENGINE_R = "r"
+ENGINE_NUMPY = "numpy"
+
+# files that determine the outcome of a simulation besides the command line,
+# per engine. simUtils/R/config.R holds the CONFIG object (seed, repetitions,
+# alpha, ...), whose design settings are shared with the NumPy engine
+SHARED_CONFIG = "./ebstatmax/simUtils/inst/config.json"
+SIMULATION_SOURCES = {
+    ENGINE_R: [
+        "./ebstatmax/diacerein.R",
+        "./ebstatmax/simUtils/R",
+        "./ebstatmax/simUtils/DESCRIPTION",
+        "./ebstatmax/simUtils/NAMESPACE",
+        SHARED_CONFIG
+    ],
+    ENGINE_NUMPY: [
+        "./utils/gpc_engine.py",
+        SHARED_CONFIG
+    ]
+}
+DEFAULT_DATASETS = {  # cf. DEFAULT_DATASET in gpc_engine.py
+    ENGINE_R: "./ebstatmax/simUtils/data/diacerein.rda",
+    ENGINE_NUMPY: "./ebstatmax/data/Diacerein_study-setup.txt"
+}
+DATASET_FLAGS = ("-d", "--dataset")
+CACHE_SUFFIX = ".json"
+
+
+def hash_file(filename: str, digest) -> None:
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+
+
+def hash_sources(paths: Iterable[str]) -> str:
+    """Hash the contents of all files (directories are walked in order)."""
+    digest = sha256()
+    for path in paths:
+        if isdir(path):
+            files = sorted(join(path, name) for name in listdir(path))
+        else:
+            files = [path]
+        for filename in files:
+            digest.update(filename.encode())
+            hash_file(filename, digest)
+    return digest.hexdigest()
+
+
+def get_dataset(command: List[str], engine=ENGINE_R) -> str:
+    for i, arg in enumerate(command[:-1]):
+        if arg in DATASET_FLAGS:
+            return command[i + 1]
+    return DEFAULT_DATASETS[engine]
+
+
+def is_finished(filename: str) -> bool:
+    """A finished result is a (complete) non-empty JSON file."""
+    try:
+        with open(filename, "r") as f:
+            return len(load(f)) > 0
+    except (OSError, JSONDecodeError):
+        return False
+
+
+class InputHash:
+    """Hash the inputs of a simulation job.
+
+    The key of a job combines its full command line, the contents of the
+    dataset it reads and the sources of the engine that runs it (hashed
+    once). Hence, changing the sources of one engine does not invalidate
+    the results of the other.
+    """
+
+    def __init__(
+        self,
+        sources: Optional[Dict[str, Iterable[str]]] = None) -> None:
+
+        if sources is None:
+            sources = SIMULATION_SOURCES
+        self.sources_hashes = {engine: hash_sources(paths)
+                               for engine, paths in sources.items()}
+        self._dataset_hashes: Dict[str, str] = {}
+        self._lock = Lock()
+
+    def key(self, command: List[str], engine=ENGINE_R) -> str:
+        dataset = get_dataset(command, engine)
+        with self._lock:
+            if dataset not in self._dataset_hashes:
+                self._dataset_hashes[dataset] = hash_sources([dataset])
+            dataset_hash = self._dataset_hashes[dataset]
+        digest = sha256()
+        digest.update("\0".join(command).encode())
+        digest.update(dataset_hash.encode())
+        digest.update(self.sources_hashes[engine].encode())
+        return digest.hexdigest()
+
+
+class ResultCache:
+    """Store finished simulation outfiles under a hash of their inputs.
+
+    Jobs are keyed by `InputHash`. Cached files are hard-linked into place
+    (or copied where linking is not possible). The total cache size is
+    bounded by `max_bytes`; the least recently used entries are evicted
+    first.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        sources: Optional[Dict[str, Iterable[str]]] = None) -> None:
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.inputs = InputHash(sources)
+        self._key_locks: Dict[str, Lock] = {}
+        self._lock = Lock()
+        makedirs(directory, exist_ok=True)
+
+    def key(self, command: List[str], engine=ENGINE_R) -> str:
+        return self.inputs.key(command, engine)
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key + CACHE_SUFFIX)
+
+    def lock(self, key: str) -> Lock:
+        """Per-key lock, so that identical jobs are computed only once."""
+        with self._lock:
+            return self._key_locks.setdefault(key, Lock())
+
+    def contains(self, key: str) -> bool:
+        return is_finished(self.path(key))
+
+    def lookup(self, key: str, outfile: str) -> bool:
+        cached = self.path(key)
+        if not is_finished(cached):
+            return False
+        if exists(outfile):
+            remove(outfile)
+        try:
+            link(cached, outfile)
+        except OSError:
+            copy2(cached, outfile)
+        utime(cached)  # mark as recently used
+        return True
+
+    def store(self, key: str, outfile: str) -> None:
+        if not is_finished(outfile):
+            return
+        cached = self.path(key)
+        if exists(cached):
+            remove(cached)
+        try:
+            link(outfile, cached)
+        except OSError:
+            copy2(outfile, cached)
+        utime(cached)
+        self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            entries = []
+            for name in listdir(self.directory):
+                if name.endswith(CACHE_SUFFIX):
+                    filename = join(self.directory, name)
+                    entries.append((stat(filename).st_mtime, filename))
+            entries.sort()  # least recently used first
+            total = sum(getsize(filename) for _, filename in entries)
+            for _, filename in entries:
+                if total <= self.max_bytes:
+                    break
+                total -= getsize(filename)
+                remove(filename)
@@ -0,0 +1,78 @@
+# fuse simulations that differ in method and side only (diacerein.R --fused)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import load, dump
+from os import makedirs, replace
+from os.path import basename, dirname, exists, join
+from typing import Dict, List, Tuple
+
+
+# global constants
+METHOD_FLAGS = ("-m", "--method")
+SIDE_FLAGS = ("-u", "--side")
+DEFAULT_SIDE = "2"
+FUSED_FLAG = "--fused"
+FUSED_SUFFIX = ".fused"
+KEY_POWER = "power"
+KEY_ALPHA_ERROR = "alpha_error"
+KEY_P_VALUES = "p_values"
+
+
+def split_method_and_side(arguments: List[str]) -> Tuple[List[str], str]:
+    """Remove method and side from command line arguments.
+
+    Return the remaining arguments and the side (as given or the default).
+    """
+    remaining = []
+    side = DEFAULT_SIDE
+    skip = False
+    for i, arg in enumerate(arguments):
+        if skip:
+            skip = False
+        elif arg in METHOD_FLAGS:
+            skip = True
+        elif arg in SIDE_FLAGS:
+            skip = True
+            if i + 1 < len(arguments):
+                side = arguments[i + 1]
+        else:
+            remaining.append(arg)
+    return remaining, side
+
+
+def fused_name(method: str, side: str) -> str:
+    """Name of an evaluation in the output of diacerein.R --fused."""
+    return "{}:{}".format(method, side)
+
+
+def summaries(output: Dict) -> List[Dict]:
+    if KEY_ALPHA_ERROR in output:
+        return [output[KEY_ALPHA_ERROR]]
+    return list(output[KEY_POWER].values())
+
+
+def split_fused_output(fused_outfile: str, outfiles: Dict[str, str]) -> None:
+    """Write the evaluations of a fused output to separate outfiles.
+
+    `outfiles` maps evaluation names (cf. `fused_name`) to outfiles. Raw
+    p-values (if any) are moved next to the respective outfile. Outfiles
+    are written atomically.
+    """
+    with open(fused_outfile, "r") as f:
+        fused = load(f)
+    for name, outfile in outfiles.items():
+        output = fused[name]
+        for summary in summaries(output):
+            if KEY_P_VALUES not in summary:
+                continue
+            source = join(dirname(fused_outfile), summary[KEY_P_VALUES])
+            directory = basename(outfile) + ".p-values"
+            makedirs(join(dirname(outfile), directory), exist_ok=True)
+            target = join(directory, basename(source))
+            if exists(source):
+                replace(source, join(dirname(outfile), target))
+            summary[KEY_P_VALUES] = target
+        tempfile = outfile + ".tmp"
+        with open(tempfile, "w") as out:
+            dump(output, out, indent=2)
+        replace(tempfile, outfile)
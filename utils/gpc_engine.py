@@ -0,0 +1,762 @@
+# in-process NumPy engine for GPC simulations (cf. ../ebstatmax/diacerein.R)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from argparse import ArgumentParser
+from json import dumps, load
+from math import erfc, sqrt as scalar_sqrt
+from os import makedirs
+from os.path import abspath, basename, dirname, join
+from re import match, sub
+from sys import argv, exit, stderr
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from numpy import abs as absolute, arange, array, asfortranarray, bincount
+from numpy import concatenate, empty, errstate, float32, frompyfunc, full
+from numpy import isin, isnan, maximum, minimum, nan, ndarray, ones
+from numpy import put_along_axis, round as round_half_even, save, sign, sqrt
+from numpy import take_along_axis, where, zeros
+from numpy.random import Generator, PCG64, SeedSequence
+from pandas import DataFrame, read_csv, to_numeric
+
+
+# settings shared with the CONFIG object of simUtils (its config.R reads the
+# same file), i.e., the simulated design is the same for both engines
+SHARED_CONFIG_FILE = join(dirname(abspath(__file__)), "..", "ebstatmax",
+                          "simUtils", "inst", "config.json")
+with open(SHARED_CONFIG_FILE, "r") as config_file:
+    SHARED_CONFIG = load(config_file)
+SEED = SHARED_CONFIG["seed"]
+REPETITIONS = SHARED_CONFIG["repetitions"]
+ALPHA = SHARED_CONFIG["alpha"]
+BLOCKLENGTH = SHARED_CONFIG["blocklength"]
+BINARY_THRESHOLD = SHARED_CONFIG["binary_threshold"]
+PARAMETERS: Dict[str, List[Dict[str, float]]] = SHARED_CONFIG["parameters"]
+MAX_VALUES = SHARED_CONFIG["max_values"]
+MIN_VALUES = SHARED_CONFIG["min_values"]
+MAIN_EFFECT_TIME = tuple(SHARED_CONFIG["main_effect_time"])
+S2_EFFECT_TIME = tuple(SHARED_CONFIG["s2_effect_time"])
+S3_EFFECT_TIME_A = tuple(SHARED_CONFIG["s3_effect_time_a"])
+S3_EFFECT_TIME_B = tuple(SHARED_CONFIG["s3_effect_time_b"])
+BASELINE_TIME = tuple(SHARED_CONFIG["baseline_time"])
+PLACEBO_GROUP = SHARED_CONFIG["placebo_group"]
+VERUM_GROUP = SHARED_CONFIG["verum_group"]
+TIME_VARIABLE = SHARED_CONFIG["time_variable"]
+GROUP_VARIABLE = SHARED_CONFIG["group_variable"]
+SUBJECT_VARIABLE = SHARED_CONFIG["subject_variable"]
+TIME_MAPPING = {int(time): mapped
+                for time, mapped in SHARED_CONFIG["time_mapping"].items()}
+REPEATED_PRIORITY = tuple(SHARED_CONFIG["repeated_priority"])
+BEST = SHARED_CONFIG["best"]
+GPC_METHODS = {  # method -> (type, matching)
+    method: (gpc["type"], gpc["matching"])
+    for method, gpc in SHARED_CONFIG["gpc_methods"].items()
+}
+VALID_SCENARIOS = tuple(SHARED_CONFIG["valid_scenarios"])
+
+# the original study data (the dataset of the simUtils package that
+# diacerein.R uses by default is built from it, cf. data-raw/diacerein.R)
+DEFAULT_DATASET = "./ebstatmax/data/Diacerein_study-setup.txt"
+DEFAULT_DATASET_NAME = "diacerein"
+DEFAULT_TARGET = "Blister_count"
+PREPROCESSED_SUFFIX = ".rds"
+DEFAULT_BATCH_SIZE = 500  # runs per batch (does not change the results)
+
+# keys of the output (cf. diacerein.R)
+SETTINGS = ("method", "target", "effect", "scenario", "side", "binarize",
+            "subtract", "dataset", "runs")
+KEY_RUNS = "runs"
+KEY_SHARD = "shard"
+KEY_CELL = "cell"
+KEY_PARAMETER = "parameter"
+KEY_SEED = "seed"
+KEY_INDEX = "index"
+KEY_COUNT = "count"
+KEY_POWER = "power"
+KEY_ALPHA_ERROR = "alpha_error"
+KEY_REJECTION_RATE = "rejection_rate"
+KEY_REJECTION_COUNT = "rejection_count"
+KEY_NA_COUNT = "NA_count"
+KEY_P_VALUES = "p_values"
+PERIODS = ("period_1", "period_2", "combined")
+NA = "NA"  # missing value as written by R's jsonlite
+
+# significance level at which rejection rates of the NumPy and the R engine
+# are considered to disagree (Bonferroni-adjusted for all compared rates)
+CROSS_CHECK_ALPHA = 0.001
+
+erfc_elementwise = frompyfunc(erfc, 1, 1)
+
+
+class Design(NamedTuple):
+    """Structure of the simulation data that is shared by all runs.
+
+    Cf. `design_index` of simUtils; indices are 0-based.
+    """
+    values: ndarray  # target variable of all rows (incl. baselines)
+    times: ndarray  # harmonized time of all rows
+    placebo: ndarray  # whether a row belongs to the placebo group
+    keep: ndarray  # testing rows, i.e., rows kept after discard_baseline
+    block: ndarray  # block of each testing row
+    treated: ndarray  # whether a block belongs to the verum group
+    time_rows: Dict[float, ndarray]  # testing rows per time, by block
+    balanced: bool  # one testing row per block and time
+    verum: ndarray  # verum blocks of subjects observed in both groups
+    control: ndarray  # placebo blocks of the same subjects
+
+
+class Draws(NamedTuple):
+    """Random numbers of all runs, drawn at once."""
+    shuffled: ndarray  # permutation of the blocks (one row per run)
+    effects: Optional[ndarray]  # effects of the main effect rows
+    noise: Optional[ndarray]  # rounded normal noise (scenario 3)
+
+
+def read_dataset(filename: str) -> DataFrame:
+    """Read a tab-separated dataset and sort it (cf. `read_data`)."""
+    data = read_csv(filename, sep="\t", decimal=",", na_values=["n/a", ""],
+                    keep_default_na=False)
+    data[TIME_VARIABLE] = to_numeric(data[TIME_VARIABLE].astype(str).str
+                                     .replace(r"\D", "", regex=True))
+    return data.sort_values([SUBJECT_VARIABLE, TIME_VARIABLE],
+                            kind="stable").reset_index(drop=True)
+
+
+def design_index(data: DataFrame, target: str, discard: bool) -> Design:
+    """Exclude blocks with missing targets, harmonize times and index."""
+    values = to_numeric(data[target]).to_numpy(dtype=float)
+    block_of_row = arange(len(data)) // BLOCKLENGTH
+    complete = ~isin(block_of_row, block_of_row[isnan(values)])
+    data = data[complete]
+    times = data[TIME_VARIABLE].map(TIME_MAPPING)
+    if times.isna().any():
+        raise ValueError("timepoints missing in the time mapping")
+    times = times.to_numpy(dtype=float)
+    placebo = (data[GROUP_VARIABLE] == PLACEBO_GROUP).to_numpy()
+
+    keep = full(len(data), True)
+    if discard:
+        keep = ~isin(times, BASELINE_TIME)
+    subject = data[SUBJECT_VARIABLE].astype(str).to_numpy()[keep]
+    group = data[GROUP_VARIABLE].astype(str).to_numpy()[keep]
+    numbers: Dict[Tuple[str, str], int] = {}
+    first_rows = []
+    block = empty(len(subject), dtype=int)
+    for row, key in enumerate(zip(subject, group)):
+        if key not in numbers:  # blocks are numbered by their first row
+            numbers[key] = len(numbers)
+            first_rows.append(row)
+        block[row] = numbers[key]
+    blocks = len(numbers)
+    block_subject = subject[first_rows]
+    treated = group[first_rows] == VERUM_GROUP
+
+    testing_times = times[keep]
+    time_rows = {}
+    for t in dict.fromkeys(testing_times):
+        rows = arange(len(subject))[testing_times == t]
+        time_rows[t] = rows[block[rows].argsort(kind="stable")]
+    balanced = all(len(rows) == blocks and (block[rows] == arange(blocks))
+                   .all() for rows in time_rows.values())
+
+    verum_blocks = {s: b for b, s in enumerate(block_subject) if treated[b]}
+    placebo_blocks = {s: b for b, s in enumerate(block_subject)
+                      if not treated[b]}
+    both = [s for s in verum_blocks if s in placebo_blocks]
+    return Design(values[complete], times, placebo, keep, block, treated,
+                  time_rows, balanced,
+                  array([verum_blocks[s] for s in both], dtype=int),
+                  array([placebo_blocks[s] for s in both], dtype=int))
+
+
+def generate_effect(
+    rng: Generator,
+    effect_type: str,
+    size: Tuple[int, int],
+    params: Dict[str, float]) -> ndarray:
+
+    """Draw random effects rounded to one digit (cf. `generate_effect`)."""
+    if effect_type == "nbinom":
+        effect = rng.negative_binomial(params["r"], params["p"], size)
+    elif effect_type == "pois":
+        effect = rng.poisson(params["lambda"], size)
+    elif effect_type == "lnorm":
+        effect = rng.lognormal(params["meanlog"], params["sdlog"], size)
+    elif effect_type == "norm":
+        effect = rng.normal(params["mean"], params["sd"], size)
+        effect = where(effect < 0, 0.0, effect)  # avoid negative values
+    else:
+        raise ValueError("invalid effect type")
+    return round_half_even(effect.astype(float), 1)
+
+
+def draw(
+    rng: Generator,
+    design: Design,
+    runs: int,
+    effect_type: Optional[str],
+    params: Optional[Dict[str, float]],
+    scenario: int) -> Draws:
+
+    """Draw the random numbers of all runs before any of them is evaluated.
+
+    Hence, the results do not depend on the number of runs per batch.
+    """
+    blocks = len(design.values) // BLOCKLENGTH
+    shuffled = rng.permuted(arange(blocks)[None, :].repeat(runs, 0), axis=1)
+    if params is None:
+        return Draws(shuffled, None, None)
+    size = (runs, len(effect_rows(design, MAIN_EFFECT_TIME)))
+    effects = generate_effect(rng, effect_type, size, params)
+    noise = None
+    if scenario == 3:
+        noise = round_half_even(rng.normal(size=size))
+    return Draws(shuffled, effects, noise)
+
+
+def effect_rows(design: Design, times: Tuple[int, int]) -> ndarray:
+    return arange(len(design.values))[isin(design.times, times) &
+                                      design.placebo]
+
+
+def simulate_targets(
+    design: Design,
+    draws: Draws,
+    runs: slice,
+    target: str,
+    scenario: int,
+    binarize: bool,
+    subtract: bool) -> ndarray:
+
+    """Target values of the testing rows of several runs (one row per run).
+
+    Cf. `simulate_targets` of simUtils: permute the blocks, add effects,
+    truncate, binarize or subtract the baseline, and discard it.
+    """
+    n = len(design.values)
+    shuffled = draws.shuffled[runs]
+    rows = shuffled[:, :, None] * BLOCKLENGTH + arange(BLOCKLENGTH)
+    targets = design.values[rows.reshape(len(shuffled), n)]
+    if draws.effects is not None:
+        effect = draws.effects[runs]
+        targets[:, effect_rows(design, MAIN_EFFECT_TIME)] += effect
+        if scenario == 2:
+            targets[:, effect_rows(design, S2_EFFECT_TIME)] += \
+                round_half_even(effect / 2, 1)
+        if scenario == 3:
+            half = round_half_even(effect / 2)
+            targets[:, effect_rows(design, S3_EFFECT_TIME_A)] += half
+            targets[:, effect_rows(design, S3_EFFECT_TIME_B)] += \
+                half + draws.noise[runs]
+        if target in MAX_VALUES:
+            targets = minimum(targets, MAX_VALUES[target])
+        if target in MIN_VALUES:
+            targets = maximum(targets, MIN_VALUES[target])
+    first_rows = arange(n) // BLOCKLENGTH * BLOCKLENGTH
+    if binarize:
+        baseline = targets[:, first_rows]
+        targets = where(targets < baseline * BINARY_THRESHOLD, 1.0, 0.0)
+    if subtract:
+        others = arange(n) != first_rows
+        targets[:, others] = targets[:, others] - \
+            targets[:, first_rows[others]]
+    return targets[:, design.keep]
+
+
+def column_ranks(values: ndarray) -> Tuple[ndarray, ndarray]:
+    """Minimum and maximum ranks of the values within each row.
+
+    Cf. `column_ranks` of simUtils, which stores runs in columns.
+    """
+    n = values.shape[1]
+    order = values.argsort(axis=1, kind="stable")
+    ordered = take_along_axis(values, order, axis=1)
+    starts = ones(values.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = ones(values.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    position = arange(1, n + 1)
+    first = maximum.accumulate(where(starts, position, 0), axis=1)
+    last = minimum.accumulate(
+        where(ends, position, n + 1)[:, ::-1], axis=1)[:, ::-1]
+    min_rank = empty(values.shape, dtype=int)
+    max_rank = empty(values.shape, dtype=int)
+    put_along_axis(min_rank, order, first, axis=1)
+    put_along_axis(max_rank, order, last, axis=1)
+    return min_rank, max_rank
+
+
+def count_wins(
+    test: ndarray,
+    control: ndarray,
+    best: str) -> Tuple[ndarray, ndarray]:
+
+    """Wins and losses of the test group per run (cf. `count_wins`)."""
+    n_test = test.shape[1]
+    n = n_test + control.shape[1]
+    all_min, all_max = column_ranks(concatenate([test, control], axis=1))
+    within_min, within_max = column_ranks(test)
+    # number of lower and higher control values for each test value
+    lower = (all_min[:, :n_test] - within_min).sum(axis=1)
+    higher = ((n - all_max[:, :n_test]) - (n_test - within_max)).sum(axis=1)
+    if best == "lower":
+        return higher, lower
+    return lower, higher
+
+
+def score_row_sums(values: ndarray, best: str) -> ndarray:
+    """Row sums of the pairwise scores per run (cf. `score_row_sums`)."""
+    min_rank, max_rank = column_ranks(values)
+    below = min_rank - 1
+    above = values.shape[1] - max_rank
+    if best == "lower":
+        return above - below
+    return below - above
+
+
+def tie_classes(classes, outcome: ndarray) -> ndarray:
+    """Refine tie classes by an additional outcome (cf. `tie_classes`)."""
+    combined = classes * (outcome.shape[1] + 1) + column_ranks(outcome)[0]
+    return column_ranks(combined)[0]
+
+
+def matched_pair_scores(
+    verum: List[ndarray],
+    placebo: List[ndarray],
+    best: str) -> List[ndarray]:
+
+    """Scores of matched pairs per priority (cf. `matched_pair_scores`)."""
+    scores = []
+    undecided = 1
+    for v, p in zip(verum, placebo):
+        s = sign(v - p)
+        if best == "lower":
+            s = -s
+        scores.append(s * undecided)
+        undecided = undecided * (scores[-1] == 0)
+    return scores
+
+
+def block_sums(targets: ndarray, block: ndarray) -> ndarray:
+    """Sum the values of each block in the order of its rows (cf. `rowsum`)."""
+    sizes = bincount(block)
+    order = block.argsort(kind="stable")
+    starts = concatenate([[0], sizes.cumsum()[:-1]])
+    position = arange(len(block)) - starts[block[order]]
+    sums = zeros((targets.shape[0], len(sizes)))
+    for k in range(sizes.max()):
+        rows = order[position == k]  # k-th row of each block
+        sums[:, block[rows]] += targets[:, rows]
+    return sums
+
+
+def gpc_statistic(
+    design: Design,
+    targets: ndarray,
+    gpc_type: str,
+    matching: str,
+    best=BEST,
+    repeated=REPEATED_PRIORITY) -> ndarray:
+
+    """Standardized GPC test statistic of each run (cf. `gpc_statistic`).
+
+    `targets` holds the values of the testing rows, one row per run.
+    """
+    treated = design.treated
+    n_patients = len(treated)
+    npairs = float(treated.sum()) * (~treated).sum()
+    denominator = npairs * n_patients * (n_patients - 1)
+
+    with errstate(divide="ignore", invalid="ignore"):
+        if gpc_type == "univariate":
+            sums = block_sums(targets, design.block)
+            if matching == "matched":
+                difference = sums[:, design.verum] - sums[:, design.control]
+                positive = (difference > 0).sum(axis=1)
+                negative = (difference < 0).sum(axis=1)
+                wins, losses = positive, negative
+                if best == "lower":
+                    wins, losses = negative, positive
+                return where((wins == 0) & (losses == 0), 0.0,
+                             (wins - losses) / sqrt(wins + losses))
+            wins, losses = count_wins(
+                sums[:, treated], sums[:, ~treated], best)
+            net_benefit = (wins - losses) / npairs
+            variance = (score_row_sums(sums, best)**2).sum(axis=1) / \
+                denominator
+            return net_benefit / sqrt(variance)
+
+        if not design.balanced:
+            raise ValueError(
+                "multivariate GPC requires one observation per block and time")
+        rows = [design.time_rows[t] for t in repeated
+                if t in design.time_rows]
+        if matching == "matched":
+            if gpc_type == "non-prioritized":
+                raise ValueError("cannot perform matched non-prioritized GPC")
+            # each pair is decided by the first priority at which both
+            # periods of the subject differ
+            scores = matched_pair_scores(
+                [targets[:, r[design.verum]] for r in rows],
+                [targets[:, r[design.control]] for r in rows], best)
+            net_benefit = sum(s.sum(axis=1) for s in scores)
+            variance = sum(absolute(s).sum(axis=1) for s in scores)
+        elif gpc_type == "prioritized":
+            net_benefit = 0.0
+            classes = 0
+            previous = (0, 0)
+            for r in rows:
+                classes = tie_classes(classes, targets[:, r])
+                wins, losses = count_wins(
+                    classes[:, treated], classes[:, ~treated], best)
+                net_benefit = net_benefit + ((wins - previous[0]) -
+                                             (losses - previous[1])) / npairs
+                previous = (wins, losses)
+            variance = (score_row_sums(classes, best)**2).sum(axis=1) / \
+                denominator
+        else:
+            net_benefit = 0.0
+            row_sums = 0
+            for r in rows:
+                outcome = targets[:, r]
+                wins, losses = count_wins(
+                    outcome[:, treated], outcome[:, ~treated], best)
+                net_benefit = net_benefit + (wins - losses) / npairs
+                row_sums = row_sums + score_row_sums(outcome, best)
+            net_benefit = net_benefit / len(rows)
+            variance = (row_sums**2).sum(axis=1) / denominator / len(rows)**2
+        return net_benefit / sqrt(variance)
+
+
+def gpc_p_values(z: ndarray, side: int) -> ndarray:
+    """One- or two-sided p-values (cf. `gpc_p_values`)."""
+    if side == 1:
+        return 0.5 * erfc_elementwise(z / scalar_sqrt(2)).astype(float)
+    return erfc_elementwise(absolute(z) / scalar_sqrt(2)).astype(float)
+
+
+def summarize_tests(p_values: ndarray, alpha=ALPHA) -> Dict:
+    """Rejection rates, rejection counts and failed tests per column.
+
+    Cf. `summarize_tests`; `p_values` has one column per period.
+    """
+    summary: Dict[str, Dict] = {KEY_REJECTION_RATE: {},
+                                KEY_REJECTION_COUNT: {},
+                                KEY_NA_COUNT: {}}
+    for column, period in enumerate(PERIODS):
+        p = p_values[:, column]
+        valid = p[~isnan(p)]
+        rejections = int((valid < alpha).sum())
+        summary[KEY_REJECTION_RATE][period] = \
+            rejections / len(valid) if len(valid) > 0 else NA
+        summary[KEY_REJECTION_COUNT][period] = rejections
+        summary[KEY_NA_COUNT][period] = len(p) - len(valid)
+    return summary
+
+
+def compute_rejection_rate(
+    rng: Generator,
+    design: Design,
+    params: Optional[Dict[str, float]],
+    options,
+    runs: int) -> ndarray:
+
+    """P-values of all runs (cf. `compute_rejection_rate`).
+
+    The p-values of period 1 and 2 are missing, as with the R engine.
+    """
+    gpc_type, matching = GPC_METHODS[options.method]
+    draws = draw(rng, design, runs, options.effect, params, options.scenario)
+    p_values = full((runs, len(PERIODS)), nan)
+    for start in range(0, runs, options.batch_size):
+        batch = slice(start, min(runs, start + options.batch_size))
+        targets = simulate_targets(design, draws, batch, options.target,
+                                   options.scenario, options.binarize,
+                                   options.subtract)
+        z = gpc_statistic(design, targets, gpc_type, matching)
+        p_values[batch, PERIODS.index("combined")] = \
+            gpc_p_values(z, options.side)
+    return p_values
+
+
+def parameter_key(params: Dict[str, float]) -> str:
+    """Name of a parameter setting in the output, e.g. "mean=2, sd=1"."""
+    return ", ".join("{}={:g}".format(name, round(value, 2))
+                     for name, value in params.items())
+
+
+def parameter_argument(params: Dict[str, float]) -> str:
+    """Parameter setting as given to `--parameter`, e.g. "mean=2,sd=1"."""
+    return ",".join("{}={!r}".format(name, value)
+                    for name, value in params.items())
+
+
+def parse_parameter(parameter: str, effect: str) -> Dict[str, float]:
+    """Parse a setting given to `--parameter` (cf. `parse_parameter`)."""
+    expected = list(PARAMETERS[effect][0])
+    try:
+        pairs = [pair.split("=") for pair in parameter.split(",")]
+        params = {name.strip(): float(value) for name, value in pairs}
+    except ValueError:
+        raise ValueError("invalid parameter '{}', must be 'name=value,...'"
+                         .format(parameter))
+    if len(params) != len(pairs) or set(params) != set(expected):
+        raise ValueError("invalid parameter '{}', must set ({}) of effect "
+                         "'{}'".format(parameter, ", ".join(expected), effect))
+    return {name: params[name] for name in expected}
+
+
+def cell_seed(seed: int, effect: str, parameter: str) -> int:
+    """Seed of a single parameter setting (cf. `cell_seed` of simUtils)."""
+    for character in effect + ":" + parameter:
+        seed = (seed * 31 + ord(character)) % 2147483647
+    return seed
+
+
+def make_names(name: str) -> str:
+    """Syntactically valid R name (cf. R's `make.names`)."""
+    name = sub(r"[^A-Za-z0-9._]", ".", name)
+    if not match(r"[A-Za-z]|\.(?![0-9])", name):
+        name = "X" + name
+    return name
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        index, count = 0, 0
+    if count < 1 or index < 1 or index > count:
+        raise ValueError(
+            "invalid shard '{}', must be 'i/K' with 1 <= i <= K".format(shard))
+    return index, count
+
+
+def argument_parser() -> ArgumentParser:
+    """Options of diacerein.R that the NumPy engine supports."""
+    parser = ArgumentParser(
+        description="Simulate GPC methods on the Diacerein study dataset "
+                    "with NumPy (cf. ebstatmax/diacerein.R).")
+    parser.add_argument("-m", "--method", default=next(iter(GPC_METHODS)))
+    parser.add_argument("-d", "--dataset")
+    parser.add_argument("-s", "--scenario", type=int, default=1)
+    parser.add_argument("-t", "--target", default=DEFAULT_TARGET)
+    parser.add_argument("-e", "--effect")
+    parser.add_argument("-b", "--binarize", action="store_true")
+    parser.add_argument("-u", "--side", type=int, default=2)
+    parser.add_argument("-r", "--subtract", action="store_true")
+    parser.add_argument("-i", "--discard", action="store_true")
+    parser.add_argument("-n", "--runs", type=int, default=REPETITIONS)
+    parser.add_argument("--shard")
+    parser.add_argument("--parameter")
+    parser.add_argument("--p-values")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--cross-check", metavar="OUTPUT",
+        help="compare the rejection rates with an output of diacerein.R "
+             "(same options) instead of printing the output; exit with "
+             "status 1 if they disagree")
+    return parser
+
+
+def parse_arguments(arguments: List[str]):
+    """Parse and check the arguments (cf. `sanity_check`)."""
+    try:
+        options = argument_parser().parse_args(arguments)
+    except SystemExit:  # do not exit when run in-process
+        raise ValueError("invalid arguments: " + " ".join(arguments))
+    if options.method not in GPC_METHODS:
+        raise ValueError("the NumPy engine only implements the GPC methods "
+                         "(" + ", ".join(GPC_METHODS) + ")")
+    if options.scenario not in VALID_SCENARIOS:
+        raise ValueError("invalid scenario")
+    if options.effect is not None and options.effect not in PARAMETERS:
+        raise ValueError("invalid effect")
+    if options.parameter is not None:
+        if options.effect is None:
+            raise ValueError("a parameter setting requires an effect")
+        parse_parameter(options.parameter, options.effect)
+    if options.side not in (1, 2):
+        raise ValueError("side must be either 1 or 2")
+    if options.binarize and options.subtract:
+        raise ValueError("binarization and subtraction of baseline do not "
+                         "make sense together")
+    if options.runs < 1 or options.batch_size < 1:
+        raise ValueError("runs and batch size must be positive")
+    if options.dataset is not None and \
+            options.dataset.endswith(PREPROCESSED_SUFFIX):
+        raise ValueError("preprocessed datasets require the R engine")
+    if options.binarize or options.subtract:
+        options.discard = True
+    return options
+
+
+def simulate(
+    arguments: List[str],
+    log: Optional[Callable[[str], None]] = None) -> Dict:
+
+    """Run a GPC simulation like `diacerein.R` with the same arguments.
+
+    Return its output (cf. the output of diacerein.R). Since the random
+    number streams of NumPy and R differ, the rejection rates agree with
+    those of diacerein.R statistically, not exactly (cf. `cross_check`).
+    """
+    if log is None:
+        def log(line: str) -> None:
+            print(line, file=stderr)
+
+    options = parse_arguments(arguments)
+    dataset = DEFAULT_DATASET if options.dataset is None else options.dataset
+    data = read_dataset(dataset)
+    design = design_index(data, options.target, options.discard)
+    removed = len(data) - len(design.values)
+    if removed > 0:
+        log("{} rows have been removed from the dataset due to NA-values."
+            .format(removed))
+    output: Dict = {
+        "method": options.method,
+        "target": options.target,
+        "effect": NA if options.effect is None else options.effect,
+        "scenario": options.scenario,
+        "side": options.side,
+        "binarize": options.binarize,
+        "subtract": options.subtract,
+        "dataset": (DEFAULT_DATASET_NAME if options.dataset is None
+                    else basename(options.dataset)),
+        "runs": options.runs
+    }
+
+    runs = options.runs
+    seed = SeedSequence(SEED)
+    if options.parameter is not None:
+        parameters = [parse_parameter(options.parameter, options.effect)]
+        cell = cell_seed(SEED, options.effect, options.parameter)
+        seed = SeedSequence(cell)
+        output[KEY_CELL] = {KEY_PARAMETER: options.parameter, KEY_SEED: cell}
+    elif options.effect is not None:
+        parameters = PARAMETERS[options.effect]
+    if options.shard is not None:
+        index, count = parse_shard(options.shard)
+        if count > options.runs:
+            raise ValueError("number of shards must not exceed the runs")
+        seed = seed.spawn(count)[index - 1]  # independent streams
+        runs = (index * runs) // count - ((index - 1) * runs) // count
+        output[KEY_SHARD] = {KEY_INDEX: index, KEY_COUNT: count,
+                             KEY_RUNS: runs}
+        log("shard {} performs {} runs".format(options.shard, runs))
+    rng = Generator(PCG64(seed))
+    if options.p_values is not None:
+        makedirs(options.p_values, exist_ok=True)
+
+    def summarize(p_values: ndarray, name: str) -> Dict:
+        summary = summarize_tests(p_values)
+        if options.p_values is not None:
+            filename = make_names(name) + ".npy"
+            save(join(options.p_values, filename),
+                 asfortranarray(p_values.astype(float32)))
+            summary[KEY_P_VALUES] = join(basename(options.p_values),
+                                         filename)
+        return summary
+
+    if options.effect is None:
+        log("computing alpha error...")
+        output[KEY_ALPHA_ERROR] = summarize(compute_rejection_rate(
+            rng, design, None, options, runs), KEY_ALPHA_ERROR)
+    else:
+        log("computing power...")
+        power = {}
+        for params in parameters:
+            key = parameter_key(params)
+            log(key)
+            power[key] = summarize(compute_rejection_rate(
+                rng, design, params, options, runs), key)
+        output[KEY_POWER] = power
+    return output
+
+
+def summaries(output: Dict) -> Dict[str, Dict]:
+    if KEY_POWER in output:
+        return output[KEY_POWER]
+    return {KEY_ALPHA_ERROR: output[KEY_ALPHA_ERROR]}
+
+
+def performed_runs(output: Dict) -> int:
+    """Number of runs of an output (of a shard, if it is one)."""
+    if KEY_SHARD in output:
+        return output[KEY_SHARD][KEY_RUNS]
+    return output[KEY_RUNS]
+
+
+def two_proportion_p_value(
+    rejections: Tuple[int, int],
+    valid: Tuple[int, int]) -> float:
+
+    """Two-sided p-value of the z-test for equal rejection rates."""
+    pooled = sum(rejections) / sum(valid)
+    variance = pooled * (1 - pooled) * (1 / valid[0] + 1 / valid[1])
+    difference = rejections[0] / valid[0] - rejections[1] / valid[1]
+    if variance == 0:
+        return 1.0 if difference == 0 else 0.0
+    return erfc(abs(difference) / scalar_sqrt(2 * variance))
+
+
+def cross_check(
+    reference: Dict,
+    output: Dict,
+    alpha=CROSS_CHECK_ALPHA) -> List[str]:
+
+    """Compare the rejection rates of two outputs with the same settings.
+
+    `reference` is typically an output of diacerein.R and `output` one of
+    `simulate`. For each rejection rate, equal rates are tested with a
+    two-proportion z-test (Bonferroni-adjusted for all compared rates).
+    Return a description of each rate that differs significantly.
+    """
+    for key in SETTINGS:
+        if reference.get(key) != output.get(key):
+            raise ValueError("outputs differ in their settings ({}: {} and "
+                             "{})".format(key, reference.get(key),
+                                          output.get(key)))
+    comparisons = []
+    expected = summaries(reference)
+    for name, summary in summaries(output).items():
+        if name not in expected:
+            raise ValueError("reference output lacks " + name)
+        both = (expected[name], summary)
+        for period in PERIODS:
+            if any(s[KEY_REJECTION_RATE][period] in (NA, None) for s in both):
+                continue
+            rejections = tuple(s[KEY_REJECTION_COUNT][period] for s in both)
+            valid = tuple(s.get(KEY_RUNS, performed_runs(o)) -
+                          s[KEY_NA_COUNT][period]
+                          for s, o in zip(both, (reference, output)))
+            comparisons.append(
+                (name, period, rejections, valid,
+                 two_proportion_p_value(rejections, valid)))
+    disagreements = []
+    for name, period, rejections, valid, p in comparisons:
+        if p < alpha / len(comparisons):
+            disagreements.append(
+                "{} ({}): rejection rate {:.4f} vs. {:.4f} (p = {:.2g})"
+                .format(name, period, rejections[0] / valid[0],
+                        rejections[1] / valid[1], p))
+    return disagreements
+
+
+def main(arguments: List[str]) -> int:
+    reference_file = argument_parser().parse_args(arguments).cross_check
+    output = simulate(arguments)
+    if reference_file is None:
+        print(dumps(output, indent=2))
+        return 0
+    with open(reference_file, "r") as f:
+        reference = load(f)
+    disagreements = cross_check(reference, output)
+    for disagreement in disagreements:
+        print(disagreement)
+    if len(disagreements) > 0:
+        return 1
+    print("rejection rates agree with", reference_file)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main(argv[1:]))
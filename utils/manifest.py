@@ -0,0 +1,81 @@
+# record the state of simulation jobs in a JSON-lines run manifest
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, loads, JSONDecodeError
+from os import makedirs
+from os.path import dirname, exists
+from threading import Lock
+from time import time
+from typing import Dict, List, Optional
+from .cache import is_finished
+
+
+# job states
+STATE_RUNNING = "running"
+STATE_FINISHED = "finished"
+STATE_FAILED = "failed"
+
+
+class RunManifest:
+    """Append-only log of job states, one JSON object per line.
+
+    The last record of an outfile determines the state of its job. Since
+    records are appended (and flushed) immediately, the manifest survives
+    an interrupted run and may be truncated at most in its last line.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.states: Dict[str, Dict] = {}
+        self._lock = Lock()
+        if exists(filename):
+            self.load()
+        outdir = dirname(filename)
+        if outdir != "":
+            makedirs(outdir, exist_ok=True)
+
+    def load(self) -> None:
+        with open(self.filename, "r") as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except JSONDecodeError:  # interrupted while writing
+                    continue
+                self.states[record["outfile"]] = record
+
+    def record(
+        self,
+        outfile: str,
+        command: List[str],
+        state: str,
+        key: Optional[str] = None) -> None:
+
+        record = {
+            "outfile": outfile,
+            "command": command,
+            "state": state,
+            "key": key,
+            "time": time()
+        }
+        with self._lock:
+            self.states[outfile] = record
+            with open(self.filename, "a") as f:
+                f.write(dumps(record) + "\n")
+
+    def is_finished(
+        self,
+        outfile: str,
+        command: List[str],
+        key: Optional[str] = None) -> bool:
+
+        """Check if a job with the same command has finished before.
+
+        If the `key` of the job's inputs (cf. `InputHash`) is given, it
+        must match as well, i.e., the outfile must not be stale.
+        """
+        record = self.states.get(outfile)
+        return (record is not None
+                and record["state"] == STATE_FINISHED
+                and record["command"] == command
+                and (key is None or record.get("key") == key)
+                and is_finished(outfile))
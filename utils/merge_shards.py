@@ -0,0 +1,123 @@
+# merge the outputs of sharded simulations (../ebstatmax/diacerein.R --shard)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import load, dump
+from numpy import asfortranarray, concatenate, load as load_npy, save
+from os import makedirs, replace
+from os.path import basename, dirname, join
+from typing import Dict, Iterable, List
+
+
+# global constants
+KEY_SHARD = "shard"
+KEY_INDEX = "index"
+KEY_COUNT = "count"
+KEY_RUNS = "runs"
+KEY_POWER = "power"
+KEY_ALPHA_ERROR = "alpha_error"
+KEY_REJECTION_RATE = "rejection_rate"
+KEY_REJECTION_COUNT = "rejection_count"
+KEY_NA_COUNT = "NA_count"
+KEY_P_VALUES = "p_values"
+NA = "NA"  # missing value as written by R's jsonlite
+
+
+def shard_filename(outfile: str, index: int, count: int) -> str:
+    return "{}.shard-{}-of-{}".format(outfile, index, count)
+
+
+def merge_summaries(summaries: List[Dict], shard_runs: List[int]) -> Dict:
+    """Add up rejection and NA counts and recompute the rejection rates."""
+    total_runs = sum(shard_runs)
+    merged = {KEY_REJECTION_RATE: {},
+              KEY_REJECTION_COUNT: {},
+              KEY_NA_COUNT: {}}
+    for column in summaries[0][KEY_NA_COUNT]:
+        rejections = sum(s[KEY_REJECTION_COUNT][column] for s in summaries)
+        failures = sum(s[KEY_NA_COUNT][column] for s in summaries)
+        valid = total_runs - failures
+        merged[KEY_REJECTION_RATE][column] = \
+            rejections / valid if valid > 0 else NA
+        merged[KEY_REJECTION_COUNT][column] = rejections
+        merged[KEY_NA_COUNT][column] = failures
+    return merged
+
+
+def merge_shards(shard_outputs: Iterable[Dict]) -> Dict:
+    """Combine shard outputs into the output of a single simulation.
+
+    The shards must stem from the same simulation settings and must be
+    complete (i.e., all indices 1, ..., K of K shards are present). Since
+    only counts are added up, the merged result does not depend on the
+    order of the shards.
+    """
+    shards = sorted(shard_outputs, key=lambda s: s[KEY_SHARD][KEY_INDEX])
+    count = shards[0][KEY_SHARD][KEY_COUNT]
+
+    # perform sanity checks
+    assert [s[KEY_SHARD][KEY_INDEX] for s in shards] == \
+        list(range(1, count + 1))
+    assert all(s[KEY_SHARD][KEY_COUNT] == count for s in shards)
+    header_keys = [key for key in shards[0]
+                   if key not in (KEY_SHARD, KEY_POWER, KEY_ALPHA_ERROR)]
+    for key in header_keys:
+        assert len(set(str(s[key]) for s in shards)) == 1
+
+    shard_runs = [s[KEY_SHARD][KEY_RUNS] for s in shards]
+    assert sum(shard_runs) == shards[0][KEY_RUNS]
+    merged = {key: shards[0][key] for key in header_keys}
+    merged["shards"] = count
+    if KEY_ALPHA_ERROR in shards[0]:
+        merged[KEY_ALPHA_ERROR] = merge_summaries(
+            [s[KEY_ALPHA_ERROR] for s in shards], shard_runs)
+    else:
+        power = {}
+        for parameters in shards[0][KEY_POWER]:
+            power[parameters] = merge_summaries(
+                [s[KEY_POWER][parameters] for s in shards], shard_runs)
+        merged[KEY_POWER] = power
+    return merged
+
+
+def merge_p_values(
+    shard_summaries: List[Dict],
+    shard_files: List[str],
+    summary: Dict,
+    outfile: str) -> None:
+
+    """Concatenate raw p-values (if any) in the order of the shards."""
+    if not all(KEY_P_VALUES in s for s in shard_summaries):
+        return
+    arrays = [load_npy(join(dirname(filename), s[KEY_P_VALUES]))
+              for s, filename in zip(shard_summaries, shard_files)]
+    directory = basename(outfile) + ".p-values"
+    name = basename(shard_summaries[0][KEY_P_VALUES])
+    makedirs(join(dirname(outfile), directory), exist_ok=True)
+    save(join(dirname(outfile), directory, name),
+         asfortranarray(concatenate(arrays)))
+    summary[KEY_P_VALUES] = join(directory, name)
+
+
+def merge_shard_files(shard_files: Iterable[str], outfile: str) -> None:
+    """Merge shard outfiles and write the result atomically to outfile."""
+    shard_outputs = {}
+    for filename in shard_files:
+        with open(filename, "r") as f:
+            shard_output = load(f)
+        shard_outputs[shard_output[KEY_SHARD][KEY_INDEX]] = \
+            (shard_output, filename)
+    ordered = [shard_outputs[index] for index in sorted(shard_outputs)]
+    files = [filename for _, filename in ordered]
+    outputs = [output for output, _ in ordered]
+    merged = merge_shards(outputs)
+    if KEY_ALPHA_ERROR in merged:
+        merge_p_values([s[KEY_ALPHA_ERROR] for s in outputs], files,
+                       merged[KEY_ALPHA_ERROR], outfile)
+    else:
+        for parameters, summary in merged[KEY_POWER].items():
+            merge_p_values([s[KEY_POWER][parameters] for s in outputs],
+                           files, summary, outfile)
+    tempfile = outfile + ".tmp"
+    with open(tempfile, "w") as out:
+        dump(merged, out, indent=2)
+    replace(tempfile, outfile)
@@ -2,20 +2,26 @@
 # pandas DataFrames
 # Copyright (C) 2022  Konstantin Emil Thiel
 
-from json import load
-from pandas import MultiIndex, DataFrame
-from typing import Iterable
-from os.path import join
+from json import dump, load
+from numpy import load as load_npy, errstate, isnan, ndarray, sqrt
+from pandas import MultiIndex, DataFrame, concat
+from typing import Dict, Iterable, Optional, Tuple, Union
+from os import replace
+from os.path import dirname, join
+from .results_store import ResultsStore
 
 
 # global constants
 KEY_POWER = "power"
 KEY_ALPHA_ERROR = "alpha_error"
 KEY_REJECTION_RATE = "rejection_rate"
-KEY_METHOD = "method"
-KEY_SIDE = "side"
-KEY_TARGET = "target"
-KEY_SCENARIO = "scenario"
+KEY_P_VALUES = "p_values"
+KEY_MCSE = "mcse"
+KEY_RUNS = "runs"
+KEY_CELL = "cell"
+KEY_SHARD = "shard"
+NA = "NA"  # missing value as written by R's jsonlite
+P_VALUE_COLUMNS = ["period_1", "period_2", "combined"]
 
 ROWNAME_MAP = {
     "meanlog=0.2, sdlog=1": (r"\mu_{\mbox{\scriptsize log}}", r"0.2"),
@@ -25,6 +31,11 @@ ROWNAME_MAP = {
     "mean=3, sd=1": (r"\mu_{\mbox{\scriptsize norm}}", r"3"),
     "mean=4, sd=1": (r"\mu_{\mbox{\scriptsize norm}}", r"4")
 }
+PARAMETER_SYMBOLS = {  # rows of settings that are not in ROWNAME_MAP
+    "meanlog": r"\mu_{\mbox{\scriptsize log}}",
+    "mean": r"\mu_{\mbox{\scriptsize norm}}",
+    "lambda": r"\lambda"
+}
 METHOD_MAP = {
     "nparld": "nparLD",
     "univariate-matched-gpc": "univariate matched GPC",
@@ -43,11 +54,51 @@ SCENARIO_MAP = {
 }
 
 
+def format_rejection_rate(summary: Dict, period: str) -> Union[float, str]:
+    """Round a rejection rate of a summary in the output of diacerein.R.
+
+    Adaptive simulations (cf. its `--target-mcse` option) stop after a
+    varying number of runs, so their rates are rendered together with the
+    Monte Carlo standard error and the number of runs, e.g.,
+    "0.9812 (0.0051, n=700)".
+    """
+    rate = summary[KEY_REJECTION_RATE][period]
+    if isinstance(rate, float):
+        rate = round(rate, 4)
+    if KEY_RUNS not in summary or rate == NA:
+        return rate
+    mcse = summary[KEY_MCSE][period]
+    if isinstance(mcse, float):
+        mcse = round(mcse, 4)
+    return "{} ({}, n={})".format(rate, mcse, summary[KEY_RUNS])
+
+
+def row_name(parameters: str) -> Tuple[str, str]:
+    """Row of a parameter setting (e.g., "mean=2, sd=1") in power tables.
+
+    Settings that have been added to the grid (cf. the `parameters` of
+    ebstatmax/simUtils/inst/config.json) are labelled by their first
+    parameter.
+    """
+    if parameters in ROWNAME_MAP:
+        return ROWNAME_MAP[parameters]
+    name, value = parameters.split(", ")[0].split("=")
+    return PARAMETER_SYMBOLS.get(name, name), value
+
+
 def prepare_power_table_segment(
     outfile_directory: str,
     outfile_columns: Iterable[Iterable[str]],
-    period: str) -> DataFrame:
+    period: str,
+    store: Optional[ResultsStore] = None) -> DataFrame:
 
+    """Build a segment of a power table from outfiles.
+
+    Outfiles are read through `store` (a temporary store if `None`), so
+    outfiles shared by several tables are parsed only once.
+    """
+    if store is None:
+        store = ResultsStore()
     table = []
     previous_rownames = []  # for sanity checking
     methods = []            # for sanity checking
@@ -59,19 +110,16 @@ def prepare_power_table_segment(
         scenarios = []  # for sanity checking
         targets = []    # for sanity checking
         for name in outfile_column:
-            filename = join(outfile_directory, name)
-            raw_data = load(open(filename, "r"))
-            power_dict = raw_data[KEY_POWER]
+            outfile = store.outfile(join(outfile_directory, name))
+            power_dict = outfile.summaries
             for parameters in power_dict:
                 rownames.append(parameters)
-                power = power_dict[parameters][KEY_REJECTION_RATE][period]
-                if isinstance(power, float):
-                    power = round(power, 4)
-                data.append(power)
-            methods.append(raw_data[KEY_METHOD])
-            sides.append(raw_data[KEY_SIDE])
-            scenarios.append(raw_data[KEY_SCENARIO])
-            targets.append(raw_data[KEY_TARGET])
+                data.append(
+                    format_rejection_rate(power_dict[parameters], period))
+            methods.append(outfile.method)
+            sides.append(outfile.side)
+            scenarios.append(outfile.scenario)
+            targets.append(outfile.target)
 
         # perform sanity checks
         assert len(set(scenarios)) == 1
@@ -88,7 +136,7 @@ def prepare_power_table_segment(
         table.append(data)
 
     table = [list(row) for row in zip(*table)]  # transpose
-    row_index = MultiIndex.from_tuples([ROWNAME_MAP[name] for name in rownames])
+    row_index = MultiIndex.from_tuples([row_name(name) for name in rownames])
     col_index = MultiIndex.from_tuples(colnames)
     return DataFrame(table, index=row_index, columns=col_index)
 
@@ -96,7 +144,13 @@ def prepare_power_table_segment(
 def prepare_alpha_error_table(
     outfile_rows: Iterable[Iterable[str]],
     periods: Iterable[str],
-    rownames: Iterable[str]) -> DataFrame:
+    rownames: Iterable[str],
+    store: Optional[ResultsStore] = None) -> DataFrame:
+
+    """Build a type-I error table from outfiles (cf. `store` in
+    `prepare_power_table_segment`)."""
+    if store is None:
+        store = ResultsStore()
 
     # perform sanity check
     assert len(outfile_rows) == len(periods) == len(rownames)
@@ -109,15 +163,12 @@ def prepare_alpha_error_table(
         methods = []  # for sanity checking
         sides = []    # for sanity checking
         for filename in outfile_row:
-            with open(filename, "r") as out:
-                raw_data = load(out)
-            alpha_error = raw_data[KEY_ALPHA_ERROR][KEY_REJECTION_RATE][period]
-            if isinstance(alpha_error, float):
-                alpha_error = round(alpha_error, 4)
-            data.append(alpha_error)
-            colnames.append(raw_data[KEY_TARGET])
-            methods.append(raw_data[KEY_METHOD])
-            sides.append(raw_data[KEY_SIDE])
+            outfile = store.outfile(filename)
+            data.append(format_rejection_rate(
+                outfile.summaries[KEY_ALPHA_ERROR], period))
+            colnames.append(outfile.target)
+            methods.append(outfile.method)
+            sides.append(outfile.side)
 
         # perform sanity checks
         assert len(set(methods)) == 1
@@ -127,3 +178,103 @@ def prepare_alpha_error_table(
         previous_colnames = colnames
         table.append(data)
     return DataFrame(table, index=rownames, columns=colnames)
+
+
+def read_p_values(outfile: str) -> Dict[str, ndarray]:
+    """Memory-map the raw p-values saved along with a simulation outfile.
+
+    Keys are the parameter settings of a power simulation or `alpha_error`.
+    Each array has one row per run and one column per test (cf.
+    `P_VALUE_COLUMNS`), failed tests are `NaN`.
+    """
+    with open(outfile, "r") as out:
+        raw_data = load(out)
+    if KEY_POWER in raw_data:
+        summaries = raw_data[KEY_POWER]
+    else:
+        summaries = {KEY_ALPHA_ERROR: raw_data[KEY_ALPHA_ERROR]}
+    directory = dirname(outfile)
+    return {key: load_npy(join(directory, summary[KEY_P_VALUES]),
+                          mmap_mode="r")
+            for key, summary in summaries.items()}
+
+
+def summarize_p_values(
+    p_values: ndarray,
+    alphas: Iterable[float]) -> DataFrame:
+
+    """Compute rejection rates and their Monte Carlo standard errors."""
+    alphas = list(alphas)
+    n = (~isnan(p_values)).sum(axis=0)
+    table = []
+    for alpha in alphas:
+        rejections = (p_values < alpha).sum(axis=0)  # NaN is not rejected
+        with errstate(divide="ignore", invalid="ignore"):
+            rate = rejections / n
+            mcse = sqrt(rate * (1 - rate) / n)
+        row = []
+        for i in range(len(P_VALUE_COLUMNS)):
+            row.extend([rate[i], mcse[i]])
+        table.append(row)
+    col_index = MultiIndex.from_product(
+        [P_VALUE_COLUMNS, [KEY_REJECTION_RATE, KEY_MCSE]])
+    return DataFrame(table, index=alphas, columns=col_index)
+
+
+def prepare_p_value_summary(
+    outfile: str,
+    alphas: Iterable[float]) -> DataFrame:
+
+    """Summarize the raw p-values of an outfile at several alpha levels."""
+    alphas = list(alphas)
+    summaries = {key: summarize_p_values(p_values, alphas)
+                 for key, p_values in read_p_values(outfile).items()}
+    return concat(summaries, names=["parameters", "alpha"])
+
+
+def cell_filename(outfile: str, parameter: str) -> str:
+    """Outfile of a single parameter setting (cf. `--parameter`)."""
+    return "{}.cell-{}".format(outfile, parameter.replace(",", "_"))
+
+
+def merge_cells(cell_outputs: Iterable[Dict]) -> Dict:
+    """Combine the outputs of single parameter settings of an effect.
+
+    The result is the output of a simulation of all settings (in the given
+    order), as tables expect it. The settings must stem from simulations
+    that differ in their parameter setting only.
+    """
+    cells = list(cell_outputs)
+    header_keys = [key for key in cells[0]
+                   if key not in (KEY_CELL, KEY_SHARD, KEY_POWER)]
+    for key in header_keys:
+        if len(set(str(c.get(key)) for c in cells)) > 1:
+            raise ValueError("cannot merge parameter settings that differ "
+                             "in '{}'".format(key))
+    merged = {key: cells[0][key] for key in header_keys}
+    power = {}
+    for cell in cells:
+        for parameters, summary in cell[KEY_POWER].items():
+            if parameters in power:
+                raise ValueError("parameter setting '{}' is simulated "
+                                 "twice".format(parameters))
+            power[parameters] = summary
+    merged[KEY_POWER] = power
+    return merged
+
+
+def merge_cell_files(cell_files: Iterable[str], outfile: str) -> None:
+    """Merge parameter setting outfiles and write the result atomically.
+
+    Since the outfiles of the settings are next to outfile, paths of raw
+    p-values (which are relative to the outfile) remain valid.
+    """
+    cell_outputs = []
+    for filename in cell_files:
+        with open(filename, "r") as f:
+            cell_outputs.append(load(f))
+    merged = merge_cells(cell_outputs)
+    tempfile = outfile + ".tmp"
+    with open(tempfile, "w") as out:
+        dump(merged, out, indent=2)
+    replace(tempfile, outfile)
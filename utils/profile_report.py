@@ -0,0 +1,147 @@
+# report hot spots from profiles of simulations (diacerein.R --profile)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import load
+from os import walk
+from os.path import join
+from typing import Dict, List, NamedTuple, Optional
+
+
+# profile files and keys (see start_profiling in ../ebstatmax/simUtils)
+PROFILE_SUFFIX = ".profile.json"
+KEY_METHOD = "method"
+KEY_RUNS = "runs"
+KEY_MEMORY_RUNS = "memory_runs"
+KEY_STAGES = "stages"
+KEY_NAME = "name"
+STAGE_STATISTICS = ("calls", "seconds", "gc_seconds", "memory_calls",
+                    "allocations", "bytes")
+
+
+class StageSummary(NamedTuple):
+    name: str
+    calls: int
+    seconds: float
+    self_seconds: float
+    gc_seconds: float
+    share: float  # of the self time of all stages
+    seconds_per_run: float
+    bytes_per_run: Optional[float]
+    allocations_per_run: Optional[float]
+
+
+def find_profiles(directory: str) -> List[str]:
+    profiles = []
+    for root, _, files in walk(directory):
+        profiles += [join(root, f) for f in files
+                     if f.endswith(PROFILE_SUFFIX)]
+    return sorted(profiles)
+
+
+def merge_profiles(profiles: List[Dict]) -> Dict[str, Dict]:
+    """Sum the statistics of the profiles of each method.
+
+    Return a dictionary that maps each method to its `runs`, `memory_runs`
+    and `stages` (a dictionary that maps stage names to statistics).
+    """
+    methods: Dict[str, Dict] = {}
+    for profile in profiles:
+        merged = methods.setdefault(profile[KEY_METHOD], {
+            KEY_RUNS: 0, KEY_MEMORY_RUNS: 0, KEY_STAGES: {}})
+        merged[KEY_RUNS] += profile[KEY_RUNS]
+        merged[KEY_MEMORY_RUNS] += profile[KEY_MEMORY_RUNS]
+        for stage in profile[KEY_STAGES]:
+            statistics = merged[KEY_STAGES].setdefault(
+                stage[KEY_NAME], dict.fromkeys(STAGE_STATISTICS, 0))
+            for key in STAGE_STATISTICS:
+                statistics[key] += stage[key]
+    return methods
+
+
+def summarize_stages(merged: Dict) -> List[StageSummary]:
+    """Rank the stages of a merged profile by their self time.
+
+    The self time of a stage excludes the time of its nested stages.
+    Times are given per timed run, i.e., per run without memory
+    measurement.
+    """
+    stages = merged[KEY_STAGES]
+    timed_runs = max(merged[KEY_RUNS] - merged[KEY_MEMORY_RUNS], 1)
+    memory_runs = merged[KEY_MEMORY_RUNS]
+    self_seconds = {}
+    for name, statistics in stages.items():
+        prefix = name + "/"
+        children = [s for n, s in stages.items() if n.startswith(prefix)
+                    and "/" not in n[len(prefix):]]
+        self_seconds[name] = max(
+            statistics["seconds"] - sum(c["seconds"] for c in children), 0)
+    total = sum(self_seconds.values())
+    summaries = []
+    for name, statistics in stages.items():
+        summaries.append(StageSummary(
+            name,
+            statistics["calls"],
+            statistics["seconds"],
+            self_seconds[name],
+            statistics["gc_seconds"],
+            self_seconds[name] / total if total > 0 else 0,
+            statistics["seconds"] / timed_runs,
+            statistics["bytes"] / memory_runs if memory_runs > 0 else None,
+            (statistics["allocations"] / memory_runs
+             if memory_runs > 0 else None)))
+    return sorted(summaries, key=lambda s: s.self_seconds, reverse=True)
+
+
+def format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return "NA"
+    for unit in ("B", "kB", "MB"):
+        if size < 1024:
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+    return "{:.1f} GB".format(size)
+
+
+def format_method_report(method: str, merged: Dict) -> str:
+    lines = [
+        "## " + method,
+        "",
+        "{} runs ({} with memory measurement)".format(
+            merged[KEY_RUNS], merged[KEY_MEMORY_RUNS]),
+        "",
+        "| stage | calls | self [s] | self [%] | total [s] | ms/run "
+        "| gc [s] | self memory/run | self allocations/run |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|---:|"
+    ]
+    for s in summarize_stages(merged):
+        lines.append(
+            "| {} | {} | {:.3f} | {:.1f} | {:.3f} | {:.3f} | {:.3f} | {} "
+            "| {} |".format(
+                s.name, s.calls, s.self_seconds, 100*s.share, s.seconds,
+                1000*s.seconds_per_run, s.gc_seconds,
+                format_bytes(s.bytes_per_run),
+                ("NA" if s.allocations_per_run is None
+                 else "{:.0f}".format(s.allocations_per_run))))
+    return "\n".join(lines)
+
+
+def profile_report(directory: str, outfile: Optional[str] = None) -> str:
+    """Merge all profiles in a directory into a hot-spot report.
+
+    Profiles are searched recursively (cf. the `profile` option of
+    `JobScheduler`). The report (markdown) contains one table per method
+    with its stages ranked by self time. It is returned and, if `outfile`
+    is given, written to this file.
+    """
+    profiles = []
+    for filename in find_profiles(directory):
+        with open(filename, "r") as f:
+            profiles.append(load(f))
+    methods = merge_profiles(profiles)
+    report = "# Profile of {} simulations\n\n".format(len(profiles))
+    report += "\n\n".join(format_method_report(method, methods[method])
+                          for method in sorted(methods)) + "\n"
+    if outfile is not None:
+        with open(outfile, "w") as f:
+            f.write(report)
+    return report
@@ -0,0 +1,253 @@
+# aggregate progress events of simulations (../ebstatmax/diacerein.R)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, loads, JSONDecodeError
+from os.path import exists, getmtime
+from sys import stdout
+from threading import Event, Lock, Thread
+from time import time
+from typing import Dict, List, Optional, TextIO, Tuple
+
+
+# keys of progress events (see progress_reporter in ../ebstatmax/simUtils)
+KEY_TOTAL_DONE = "total_done"
+KEY_TOTAL = "total"
+
+# telemetry log entries
+TYPE_EVENT = "event"
+TYPE_STATUS = "status"
+
+RATE_WINDOW = 60.0  # seconds over which the overall rate is averaged
+
+
+class JobProgress:
+    """Progress of a running simulation, read from its progress file."""
+
+    def __init__(self, name: str, filename: str) -> None:
+        self.name = name
+        self.filename = filename
+        self.offset = 0
+        self.started = time()
+        self.updated = self.started
+        self.event: Optional[Dict] = None
+
+    def read_events(self) -> List[Dict]:
+        """Return the events appended to the progress file since last read."""
+        if not exists(self.filename):
+            return []
+        with open(self.filename, "r") as f:
+            f.seek(self.offset)
+            lines = f.readlines()
+            if len(lines) > 0 and not lines[-1].endswith("\n"):
+                lines.pop()  # incomplete line, read again next time
+            self.offset += sum(len(line) for line in lines)
+        events = []
+        for line in lines:
+            try:
+                events.append(loads(line))
+            except JSONDecodeError:
+                continue
+        if len(events) > 0:
+            self.event = events[-1]
+            self.updated = getmtime(self.filename)
+        return events
+
+    def done(self) -> int:
+        return 0 if self.event is None else self.event[KEY_TOTAL_DONE]
+
+    def total(self) -> Optional[int]:
+        return None if self.event is None else self.event[KEY_TOTAL]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return "{}h{:02d}m".format(seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return "{}m{:02d}s".format(seconds // 60, seconds % 60)
+    return "{}s".format(seconds)
+
+
+class ProgressMonitor:
+    """Aggregate the progress of all running simulations.
+
+    Simulations write progress events to files (cf. the `--progress`
+    option of diacerein.R) that are polled every `interval` seconds. The
+    monitor shows a single status line with the number of finished,
+    running and pending simulations, the runs done out of the (estimated)
+    total, the overall rate of runs per second, an ETA, and the number of
+    simulations without progress events for `stall_after` seconds. On a
+    terminal, the line is updated in place; otherwise it is printed every
+    `report_every` seconds. All events, tagged with the name of their
+    simulation, and the status are appended to the `telemetry` log (JSON
+    lines).
+
+    Simulations are grouped into units (e.g., fused simulations, see
+    `JobScheduler`) of which at most one simulation runs at a time. The
+    total number of runs of pending units is estimated from the units
+    that have started.
+    """
+
+    def __init__(
+        self,
+        telemetry: Optional[str] = None,
+        interval=2.0,
+        stall_after=300.0,
+        report_every=60.0,
+        stream: TextIO = stdout) -> None:
+
+        self.telemetry = telemetry
+        self.interval = interval
+        self.stall_after = stall_after
+        self.report_every = report_every
+        self.stream = stream
+        self.live = stream.isatty()
+        self.expected = 0
+        self.completed = 0
+        self.running: Dict[str, JobProgress] = {}
+        self.finished_done = 0  # runs done by finished simulations
+        self.finished_totals: List[int] = []
+        self.history: List[Tuple[float, int]] = []  # (time, runs done)
+        self.status = ""
+        self.last_report = 0.0
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def expect(self, units: int) -> None:
+        with self._lock:
+            self.expected += units
+
+    def start(self, name: str, filename: str) -> None:
+        """Start to follow the progress file of a simulation."""
+        with self._lock:
+            self.running[name] = JobProgress(name, filename)
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, name: str) -> None:
+        """Stop following a simulation (finished or failed)."""
+        with self._lock:
+            job = self.running.pop(name, None)
+            if job is None:
+                return
+            self._record(job, job.read_events())
+            self.finished_done += job.done()
+            if job.event is not None:  # runs actually done (adaptive, failed)
+                self.finished_totals.append(job.done())
+
+    def complete(self) -> None:
+        """Record that a unit has completed (run, cached or failed)."""
+        with self._lock:
+            self.completed += 1
+
+    def log(self, *args, **kwargs) -> None:
+        """Print a message without garbling the live status line."""
+        with self._lock:
+            if self.live and self.status:
+                self.stream.write("\r\033[K")
+            print(*args, **kwargs, file=self.stream, flush=True)
+            if self.live and self.status and kwargs.get("end", "\n") == "\n":
+                self.stream.write(self.status)
+                self.stream.flush()
+
+    def _record(self, job: JobProgress, events: List[Dict]) -> None:
+        if self.telemetry is None or len(events) == 0:
+            return
+        with open(self.telemetry, "a") as f:
+            for event in events:
+                f.write(dumps({"type": TYPE_EVENT, "job": job.name,
+                               **event}) + "\n")
+
+    def poll(self) -> Dict:
+        """Read new events and return the aggregated status."""
+        with self._lock:
+            now = time()
+            done = self.finished_done
+            totals = list(self.finished_totals)
+            unknown = 0
+            stalled = []
+            for job in self.running.values():
+                self._record(job, job.read_events())
+                done += job.done()
+                if job.total() is None:
+                    unknown += 1
+                else:
+                    totals.append(job.total())
+                if now - job.updated > self.stall_after:
+                    stalled.append(job.name)
+            pending = max(
+                self.expected - self.completed - len(self.running), 0)
+            mean_total = sum(totals) / len(totals) if totals else None
+            total = None
+            if mean_total is not None:
+                total = sum(totals) + (pending + unknown) * mean_total
+            self.history.append((now, done))
+            while now - self.history[0][0] > RATE_WINDOW:
+                self.history.pop(0)
+            elapsed = now - self.history[0][0]
+            rate = (done - self.history[0][1]) / elapsed if elapsed > 0 else 0
+            eta = None
+            if total is not None and rate > 0:
+                eta = max(total - done, 0) / rate
+            status = {
+                "type": TYPE_STATUS,
+                "time": now,
+                "completed": self.completed,
+                "running": len(self.running),
+                "pending": pending,
+                "done": done,
+                "total": total,
+                "rate": rate,
+                "eta": eta,
+                "stalled": stalled
+            }
+            if self.telemetry is not None:
+                with open(self.telemetry, "a") as f:
+                    f.write(dumps(status) + "\n")
+            return status
+
+    def format_status(self, status: Dict) -> str:
+        line = "[{} done, {} running, {} pending] {} runs".format(
+            status["completed"], status["running"], status["pending"],
+            status["done"])
+        if status["total"] is not None and status["total"] > 0:
+            line += " of ~{} ({:.0%})".format(
+                int(status["total"]), status["done"] / status["total"])
+        line += ", {:.1f} runs/s".format(status["rate"])
+        if status["eta"] is not None:
+            line += ", ETA " + format_duration(status["eta"])
+        if len(status["stalled"]) > 0:
+            line += ", {} stalled".format(len(status["stalled"]))
+        return line
+
+    def report(self) -> None:
+        status = self.poll()
+        line = self.format_status(status)
+        with self._lock:
+            if self.live:
+                self.status = line
+                self.stream.write("\r\033[K" + line)
+                self.stream.flush()
+            elif status["time"] - self.last_report >= self.report_every:
+                self.last_report = status["time"]
+                print(line, file=self.stream, flush=True)
+                for name in status["stalled"]:
+                    print("  no progress for", name, file=self.stream,
+                          flush=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.report()
+        if self.live:
+            with self._lock:
+                self.stream.write("\n")
+                self.status = ""
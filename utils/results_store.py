@@ -0,0 +1,220 @@
+# indexed store of simulation results (../ebstatmax/diacerein.R outfiles)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, load, loads
+from os import makedirs, stat, walk
+from os.path import abspath, dirname, join
+from sqlite3 import connect
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# keys of outfiles
+KEY_POWER = "power"
+KEY_ALPHA_ERROR = "alpha_error"
+KEY_REJECTION_RATE = "rejection_rate"
+KEY_MCSE = "mcse"
+KEY_RUNS = "runs"
+KEY_METHOD = "method"
+KEY_SIDE = "side"
+KEY_TARGET = "target"
+KEY_SCENARIO = "scenario"
+KEY_EFFECT = "effect"
+KEY_DATASET = "dataset"
+KEY_SUBTRACT = "subtract"
+OUTFILE_SUFFIX = ".json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outfiles (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    method TEXT,
+    side INTEGER,
+    target TEXT,
+    scenario INTEGER,
+    effect TEXT,
+    dataset TEXT,
+    baseline INTEGER
+);
+CREATE INDEX IF NOT EXISTS outfiles_settings ON outfiles (
+    method, side, target, scenario, effect, dataset, baseline);
+CREATE TABLE IF NOT EXISTS rates (
+    path TEXT NOT NULL REFERENCES outfiles (path) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    parameters TEXT NOT NULL,
+    period TEXT NOT NULL,
+    rate TEXT NOT NULL,
+    mcse TEXT,
+    runs INTEGER,
+    PRIMARY KEY (path, parameters, period)
+);
+CREATE INDEX IF NOT EXISTS rates_period ON rates (period, path);
+"""
+
+
+class StoredOutfile(NamedTuple):
+    """Settings and summaries of an outfile, as needed to build tables.
+
+    `summaries` maps the parameter settings of a power simulation (in the
+    order of the outfile) or `alpha_error` to summaries in the format of
+    the outfile, restricted to rejection rates, Monte Carlo standard
+    errors and runs (cf. `format_rejection_rate`).
+    """
+    method: str
+    side: int
+    target: str
+    scenario: int
+    effect: str
+    dataset: Optional[str]
+    baseline: Optional[bool]
+    summaries: Dict[str, Dict]
+
+
+def file_state(path: str) -> Tuple[int, int]:
+    info = stat(path)
+    return info.st_mtime_ns, info.st_size
+
+
+class ResultsStore:
+    """SQLite database of the rejection rates of all simulation outfiles.
+
+    Each outfile is parsed only once: its settings (method, side, target,
+    scenario, effect, dataset and whether the baseline was subtracted) and
+    its rejection rates per parameter setting and period are stored in
+    indexed tables. An outfile is ingested again only if it has changed
+    (modification time or size). Lookups are memoized, such that tables
+    that share outfiles do not query them again.
+    """
+
+    def __init__(self, database=":memory:") -> None:
+        if database != ":memory:" and dirname(database) != "":
+            makedirs(dirname(database), exist_ok=True)
+        self._connection = connect(database, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(SCHEMA)
+        self._lock = Lock()
+        self._memo: Dict[Tuple[str, int, int], StoredOutfile] = {}
+
+    def ingest(self, outfile: str) -> None:
+        """Parse an outfile and store it (unless it is stored already)."""
+        path = abspath(outfile)
+        mtime_ns, size = file_state(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT mtime_ns, size FROM outfiles WHERE path = ?",
+                (path,)).fetchone()
+            if row == (mtime_ns, size):
+                return
+            with open(path, "r") as f:
+                output = load(f)
+            if KEY_POWER in output:
+                summaries = output[KEY_POWER]
+            else:
+                summaries = {KEY_ALPHA_ERROR: output[KEY_ALPHA_ERROR]}
+            subtract = output.get(KEY_SUBTRACT)
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM outfiles WHERE path = ?", (path,))
+                self._connection.execute(
+                    "INSERT INTO outfiles VALUES ({})".format(
+                        ", ".join("?" * 10)),
+                    (path, mtime_ns, size, output[KEY_METHOD],
+                     output[KEY_SIDE], output[KEY_TARGET],
+                     output[KEY_SCENARIO], output[KEY_EFFECT],
+                     output.get(KEY_DATASET),
+                     None if subtract is None else int(subtract)))
+                self._connection.executemany(
+                    "INSERT INTO rates VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(path, position, parameters, period, dumps(rate),
+                      (dumps(summary[KEY_MCSE][period])
+                       if KEY_MCSE in summary else None),
+                      summary.get(KEY_RUNS))
+                     for position, (parameters, summary)
+                     in enumerate(summaries.items())
+                     for period, rate in summary[KEY_REJECTION_RATE].items()])
+
+    def ingest_directory(self, directory: str) -> int:
+        """Ingest all outfiles in a directory (recursively).
+
+        Return the number of outfiles found. Files that are not outfiles
+        of simulations (e.g., profiles) are skipped.
+        """
+        count = 0
+        for root, _, files in walk(directory):
+            for name in sorted(files):
+                if not name.endswith(OUTFILE_SUFFIX):
+                    continue
+                try:
+                    self.ingest(join(root, name))
+                    count += 1
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return count
+
+    def outfile(self, outfile: str) -> StoredOutfile:
+        """Look up an outfile (ingesting it first if necessary)."""
+        path = abspath(outfile)
+        key = (path,) + file_state(path)
+        if key in self._memo:
+            return self._memo[key]
+        self.ingest(path)
+        with self._lock:
+            settings = self._connection.execute(
+                "SELECT method, side, target, scenario, effect, dataset, "
+                "baseline FROM outfiles WHERE path = ?", (path,)).fetchone()
+            rows = self._connection.execute(
+                "SELECT parameters, period, rate, mcse, runs FROM rates "
+                "WHERE path = ? ORDER BY position", (path,)).fetchall()
+        summaries: Dict[str, Dict] = {}
+        for parameters, period, rate, mcse, runs in rows:
+            summary = summaries.setdefault(
+                parameters, {KEY_REJECTION_RATE: {}})
+            summary[KEY_REJECTION_RATE][period] = loads(rate)
+            if mcse is not None:
+                summary.setdefault(KEY_MCSE, {})[period] = loads(mcse)
+            if runs is not None:
+                summary[KEY_RUNS] = runs
+        baseline = None if settings[6] is None else bool(settings[6])
+        stored = StoredOutfile(*settings[:6], baseline, summaries)
+        self._memo[key] = stored
+        return stored
+
+    def query(self, period: Optional[str] = None, **settings) -> List[Dict]:
+        """Return the rejection rates of all ingested outfiles that match.
+
+        `settings` may restrict method, side, target, scenario, effect,
+        dataset and baseline; e.g., `query("combined", method="nparld",
+        baseline=False)`. Each result contains the settings, the path of
+        the outfile, the parameters, the period and the rejection rate.
+        """
+        columns = ("method", "side", "target", "scenario", "effect",
+                   "dataset", "baseline")
+        unknown = set(settings) - set(columns)
+        if unknown:
+            raise ValueError("unknown settings: " + ", ".join(unknown))
+        conditions = ["o.{} = ?".format(c) for c in settings]
+        values = [int(v) if isinstance(v, bool) else v
+                  for v in settings.values()]
+        if period is not None:
+            conditions.append("r.period = ?")
+            values.append(period)
+        where = " AND ".join(conditions) if conditions else "1"
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT o.path, " + ", ".join("o." + c for c in columns) +
+                ", r.parameters, r.period, r.rate FROM outfiles o JOIN rates "
+                "r ON o.path = r.path WHERE " + where +
+                " ORDER BY o.path, r.position, r.period", values).fetchall()
+        names = ("path",) + columns + ("parameters", "period", "rate")
+        results = []
+        for row in rows:
+            result = dict(zip(names, row))
+            result["rate"] = loads(result["rate"])
+            if result["baseline"] is not None:
+                result["baseline"] = bool(result["baseline"])
+            results.append(result)
+        return results
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,127 @@
+# record runtimes of simulation jobs (../ebstatmax/diacerein.R) and predict
+# the runtimes of future jobs from them
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, loads, JSONDecodeError
+from os import makedirs
+from os.path import basename, dirname, exists
+from threading import Lock
+from time import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# command line arguments of diacerein.R that determine a job's runtime
+METHOD_FLAGS = ("-m", "--method")
+TARGET_FLAGS = ("-t", "--target")
+DATASET_FLAGS = ("-d", "--dataset")
+ENGINE_FLAG = "--engine"  # added for jobs that do not run diacerein.R
+DEFAULT_TARGET = "Blister_count"
+DEFAULT_DATASET = "diacerein"
+# options that name files of a particular job (cf. JobScheduler.execute)
+FILE_FLAGS = ("--checkpoint", "--p-values", "--progress", "--profile")
+
+
+class Prediction(NamedTuple):
+    seconds: Optional[float]
+    memory: Optional[float]  # peak resident set size in megabytes
+
+
+def option_value(
+    arguments: List[str],
+    flags: Tuple[str, ...],
+    default: str) -> str:
+
+    for i, arg in enumerate(arguments[:-1]):
+        if arg in flags:
+            return arguments[i + 1]
+    return default
+
+
+def runtime_keys(arguments: List[str]) -> List[str]:
+    """Keys of a job, from its exact settings to its method only.
+
+    `arguments` are the command line arguments of diacerein.R. The exact
+    key comprises all arguments except files of the particular job (the
+    dataset is identified by its file name). Coarser keys comprise method,
+    target and dataset, and the method only. Jobs of another engine (cf.
+    `gpc_engine`) are marked by `--engine` in `arguments`, which is part of
+    all keys.
+    """
+    exact = []
+    skip = False
+    for i, arg in enumerate(arguments):
+        if skip:
+            skip = False
+            continue
+        if arg in FILE_FLAGS:
+            skip = True
+            continue
+        if i > 0 and arguments[i - 1] in DATASET_FLAGS:
+            arg = basename(arg)
+        exact.append(arg)
+    method = option_value(arguments, METHOD_FLAGS, "")
+    if ENGINE_FLAG in arguments:  # e.g., "numpy univariate-matched-gpc"
+        method = option_value(arguments, (ENGINE_FLAG,), "") + " " + method
+    target = option_value(arguments, TARGET_FLAGS, DEFAULT_TARGET)
+    dataset = basename(option_value(arguments, DATASET_FLAGS,
+                                    DEFAULT_DATASET))
+    return [" ".join(exact), " ".join([method, target, dataset]), method]
+
+
+class RuntimeHistory:
+    """Append-only log of job runtimes, one JSON object per line.
+
+    Each record holds the keys of a job (see `runtime_keys`), its runtime
+    in seconds and its peak memory (if known). The runtime of a job is
+    predicted by its latest record with the same exact key or, if there is
+    none, by the mean of the latest records of all exact keys with the
+    same coarser key.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.latest: Dict[str, Dict] = {}  # exact key -> record
+        self._lock = Lock()
+        if exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    try:
+                        record = loads(line)
+                    except JSONDecodeError:  # interrupted while writing
+                        continue
+                    self.latest[record["keys"][0]] = record
+        outdir = dirname(filename)
+        if outdir != "":
+            makedirs(outdir, exist_ok=True)
+
+    def record(
+        self,
+        arguments: List[str],
+        seconds: float,
+        memory: Optional[float] = None) -> None:
+
+        record = {
+            "keys": runtime_keys(arguments),
+            "seconds": seconds,
+            "memory": memory,
+            "time": time()
+        }
+        with self._lock:
+            self.latest[record["keys"][0]] = record
+            with open(self.filename, "a") as f:
+                f.write(dumps(record) + "\n")
+
+    def predict(self, arguments: List[str]) -> Prediction:
+        keys = runtime_keys(arguments)
+        with self._lock:
+            records = list(self.latest.values())
+        for level, key in enumerate(keys):
+            matches = [r for r in records if r["keys"][level] == key]
+            if len(matches) == 0:
+                continue
+            memories = [r["memory"] for r in matches
+                        if r["memory"] is not None]
+            return Prediction(
+                sum(r["seconds"] for r in matches) / len(matches),
+                max(memories) if memories else None)
+        return Prediction(None, None)
@@ -0,0 +1,736 @@
+# schedule simulation jobs (../ebstatmax/diacerein.R) on a pool of workers
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from json import dump, dumps, load
+from threading import Lock
+from time import perf_counter
+from os import cpu_count, makedirs, remove, replace, wait4, walk
+from os import waitstatus_to_exitcode
+from os.path import exists, dirname, getmtime, isdir, join
+from shutil import rmtree
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from typing import Tuple, Union
+from .cache import ENGINE_NUMPY, ENGINE_R, InputHash, ResultCache
+from .manifest import RunManifest
+from .manifest import STATE_RUNNING, STATE_FINISHED, STATE_FAILED
+from .merge_shards import shard_filename, merge_shard_files
+from .worker_pool import WorkerPool
+from .work_queue import WorkQueue
+from .progress import ProgressMonitor
+from .profile_report import PROFILE_SUFFIX
+from .fusion import FUSED_FLAG, FUSED_SUFFIX, fused_name
+from .fusion import split_method_and_side, split_fused_output
+from .runtime_history import ENGINE_FLAG, Prediction, RuntimeHistory
+from .runtime_history import option_value
+from .gpc_engine import PARAMETERS, cross_check, parameter_argument, simulate
+from .prepare_tables import cell_filename, merge_cell_files
+
+
+# simulation programs (jobs of the NumPy engine run in-process, the command
+# is equivalent)
+R_PROGRAM = ["Rscript", "./ebstatmax/diacerein.R"]
+NUMPY_PROGRAM = ["python3", "-m", "utils.gpc_engine"]
+EFFECT_FLAGS = ("-e", "--effect")
+PARAMETER_FLAG = "--parameter"
+
+# suffixes of intermediate files next to an outfile
+TEMP_SUFFIX = ".tmp"
+CHECKPOINT_SUFFIX = ".checkpoint"
+P_VALUES_SUFFIX = ".p-values"
+PROGRESS_SUFFIX = ".progress"
+REFERENCE_SUFFIX = ".r-reference"  # R engine output to cross-check against
+CROSS_CHECK_SUFFIX = ".cross-check"
+
+
+class SimulationJob(NamedTuple):
+    method: str
+    options: str
+    extra_args: str
+    outfile: str
+    engine: str = ENGINE_R
+
+    def arguments(self) -> List[str]:
+        arguments = ["-m", self.method] + self.options.split()
+        if len(self.extra_args) > 0:
+            arguments += self.extra_args.split()
+        return arguments
+
+    def command(self) -> List[str]:
+        if self.engine == ENGINE_NUMPY:
+            return NUMPY_PROGRAM + self.arguments()
+        return R_PROGRAM + self.arguments()
+
+
+def fusion_key(job: SimulationJob) -> Tuple[str, ...]:
+    """Jobs with the same key differ in method and side only."""
+    arguments, _ = split_method_and_side(job.arguments())
+    return tuple(arguments)
+
+
+def fuse_jobs(jobs: List[SimulationJob]) -> Tuple[SimulationJob,
+                                                   Dict[str, str]]:
+    """Combine jobs with the same fusion key into a single job.
+
+    Return the fused job and a map from evaluation names (cf. the output of
+    `diacerein.R --fused`) to the outfiles of the original jobs.
+    """
+    outfiles = {}
+    for job in jobs:
+        _, side = split_method_and_side(job.arguments())
+        outfiles[fused_name(job.method, side)] = job.outfile
+    options, _ = split_method_and_side(jobs[0].options.split())
+    extra_args, _ = split_method_and_side(jobs[0].extra_args.split())
+    extra_args += [FUSED_FLAG, ",".join(outfiles)]
+    fused = SimulationJob(jobs[0].method, " ".join(options),
+                          " ".join(extra_args), jobs[0].outfile + FUSED_SUFFIX)
+    return fused, outfiles
+
+
+class Task(NamedTuple):
+    name: str
+    function: Callable[[], None]
+    dependencies: List[str]  # outfiles
+    outputs: List[str]  # files written by the task
+    sources: List[str]  # other files (or directories) the task reads
+
+
+def newest_mtime(paths: Iterable[str]) -> float:
+    """Latest modification time of all files (directories are walked)."""
+    newest = 0.0
+    for path in paths:
+        if isdir(path):
+            for root, _, files in walk(path):
+                newest = max([newest] + [getmtime(join(root, name))
+                                         for name in files])
+        else:
+            newest = max(newest, getmtime(path))
+    return newest
+
+
+def is_up_to_date(task: Task) -> bool:
+    """Whether all outputs of a task are newer than all of its inputs."""
+    if len(task.outputs) == 0 or not all(exists(f) for f in task.outputs):
+        return False
+    inputs = task.dependencies + task.sources
+    if not all(exists(f) for f in inputs):
+        return False
+    return min(getmtime(f) for f in task.outputs) >= newest_mtime(inputs)
+
+
+# a (fused) group of jobs and its predicted runtime and memory
+QueuedGroup = Tuple[List[SimulationJob], Prediction]
+
+
+class SchedulePlan(NamedTuple):
+    makespan: float  # predicted seconds until all jobs have finished
+    jobs: int  # jobs (or fused groups of jobs) that need to run
+    unknown: int  # jobs without a prediction (assumed to take the mean)
+
+
+def p_values_dir(outfile: str) -> str:
+    return outfile + P_VALUES_SUFFIX
+
+
+def default_worker_count() -> int:
+    count = cpu_count()
+    return count if count is not None else 1
+
+
+def next_admissible(
+    memories: List[float],
+    used: float,
+    running: int,
+    memory_limit: Optional[float]) -> Optional[int]:
+
+    """Index of the first queued job that fits into the memory limit.
+
+    If nothing is running, the first job is admitted in any case.
+    """
+    if len(memories) == 0:
+        return None
+    if running == 0 or memory_limit is None:
+        return 0
+    for index, memory in enumerate(memories):
+        if used + memory <= memory_limit:
+            return index
+    return None
+
+
+class JobScheduler:
+    """Collect simulation jobs and table tasks, then run them on a pool.
+
+    Jobs are identified by their outfile. Each job runs as a separate
+    `Rscript` child process, so a pool of threads that wait on these
+    processes is sufficient to keep `workers` cores busy. A task (e.g.,
+    building a table) is executed in the calling thread as soon as all
+    files it depends on have been written successfully, unless its outputs
+    are newer than these files and its sources (like make).
+
+    If a `ResultCache` is given, jobs whose results are cached are not run
+    again. If a `RunManifest` is given, job states are recorded in it and,
+    with `resume=True`, jobs that have finished in a previous run are
+    skipped, unless their inputs (dataset or simulation sources, cf.
+    `InputHash`) have changed since. Outfiles are written to a temporary
+    file first and renamed once R has finished, so an interrupted job
+    never leaves a truncated outfile behind. The permutation runs of each
+    job are checkpointed next to its outfile and continued by later
+    attempts, unless the inputs of the job have changed in between (the
+    checkpoints record the key of the inputs, cf. the `--checkpoint-key`
+    option of diacerein.R).
+
+    With `shards > 1`, each job is split into as many shards (cf. the
+    `--shard` option of diacerein.R) and a task merges their outputs into
+    the outfile of the job.
+
+    With `save_p_values=True`, the p-values of all runs are saved in a
+    directory next to each outfile (cf. the `--p-values` option of
+    diacerein.R). Cached results are only reused if these files exist.
+
+    With `batch_size > 1`, diacerein.R processes this many permutation runs
+    at once (cf. its `--batch-size` option). Since the results do not depend
+    on the batch size, it is not part of the cache key.
+
+    If a `WorkerPool` is given, jobs are run by its persistent R workers
+    instead of a new `Rscript` process per job. A `WorkQueue` runs them on
+    the workers of other machines instead.
+
+    With `fuse=True`, jobs that differ in method and side only are run as
+    a single fused simulation (cf. the `--fused` option of diacerein.R),
+    which permutes the data and draws the effects only once for all of
+    them. Its output is split into the outfiles of the original jobs, which
+    are cached and recorded individually.
+
+    If a `ProgressMonitor` is given, simulations write progress events to a
+    file next to their outfile (cf. the `--progress` option of diacerein.R),
+    which the monitor aggregates while they are running.
+
+    With `profile=True`, simulations write a profile of their stages next
+    to their outfile (cf. the `--profile` option of diacerein.R, and
+    `profile_report`). Since a profile measures a run, the cache is not
+    used.
+
+    If a `RuntimeHistory` is given, the runtime and peak memory of each
+    finished simulation are recorded in it, and jobs are started in the
+    order of their predicted runtimes (longest first; jobs without a
+    prediction first of all). With a `memory_limit` (in megabytes), a job
+    is only started while the predicted peak memory of all running jobs
+    stays below the limit; smaller jobs further back in the queue may be
+    started instead. `plan` predicts the makespan without running anything.
+
+    Jobs of the NumPy engine (cf. `gpc_engine`) run in the worker thread
+    itself instead of a child process or the pool; they are never fused and
+    report neither progress nor profiles. With `cross_check=True`, each of
+    them is also run by the R engine (into a file next to its outfile) and
+    a task tests whether the rejection rates of both agree statistically.
+    Disagreements are collected in `disagreements` (outfile -> rates).
+
+    With `per_parameter=True`, power simulations are split into one job per
+    parameter setting of their effect (cf. the `--parameter` option of
+    diacerein.R). The settings are those of `gpc_engine.PARAMETERS`, i.e.,
+    of ebstatmax/simUtils/inst/config.json, from which the CONFIG of
+    simUtils is built as well. Each setting uses a random seed derived from
+    the effect and the setting, so settings are cached, resumed and sharded
+    individually, and adding a setting to the grid does not rerun the
+    others. A task
+    merges the outfiles of the settings into the outfile of the job (cf.
+    `merge_cell_files`).
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        manifest: Optional[RunManifest] = None,
+        resume=False,
+        shards=1,
+        save_p_values=False,
+        batch_size=1,
+        pool: Optional[Union[WorkerPool, WorkQueue]] = None,
+        fuse=False,
+        monitor: Optional[ProgressMonitor] = None,
+        profile=False,
+        history: Optional[RuntimeHistory] = None,
+        memory_limit: Optional[float] = None,
+        cross_check=False,
+        per_parameter=False) -> None:
+
+        self.cache = cache
+        self.manifest = manifest
+        self.resume = resume
+        self.shards = shards
+        self.save_p_values = save_p_values
+        self.batch_size = batch_size
+        self.pool = pool
+        self.fuse = fuse
+        self.monitor = monitor
+        self.profile = profile
+        self.history = history
+        self.memory_limit = memory_limit
+        self.cross_check = cross_check
+        self.per_parameter = per_parameter
+        self.inputs = cache.inputs if cache is not None else InputHash()
+        self.jobs: Dict[str, SimulationJob] = {}
+        self.tasks: List[Task] = []
+        # outfile -> outfiles of its shards or parameter settings
+        self.merged: Dict[str, List[str]] = {}
+        self.disagreements: Dict[str, List[str]] = {}
+        self._print_lock = Lock()
+
+    def submit(self, job: SimulationJob) -> str:
+        if self.cross_check and job.engine == ENGINE_NUMPY:
+            self.submit_cross_check(job)
+        effect = option_value(job.arguments(), EFFECT_FLAGS, None)
+        if self.per_parameter and effect is not None:
+            return self.submit_cells(job, effect)
+        if self.shards > 1:
+            return self.submit_sharded(job)
+        return self.add_job(job)
+
+    def submit_cross_check(self, job: SimulationJob) -> None:
+        """Run a job of the NumPy engine by R as well and compare them."""
+        reference = self.submit(job._replace(
+            engine=ENGINE_R, outfile=job.outfile + REFERENCE_SUFFIX))
+        report = job.outfile + CROSS_CHECK_SUFFIX
+
+        def check() -> None:
+            with open(reference, "r") as f:
+                expected = load(f)
+            with open(job.outfile, "r") as f:
+                output = load(f)
+            try:
+                disagreements = cross_check(expected, output)
+            except (ValueError, KeyError) as e:  # outputs are incomparable
+                disagreements = ["cannot compare outputs: " + str(e)]
+            with open(report, "w") as f:
+                dump(disagreements, f, indent=2)
+            if len(disagreements) > 0:
+                self.disagreements[job.outfile] = disagreements
+                self.log("  NumPy and R engine disagree for", job.outfile)
+            else:
+                self.log("  NumPy and R engine agree for", job.outfile)
+
+        self.add_task("cross-checking " + job.outfile, check,
+                      [job.outfile, reference], [report])
+
+    def submit_cells(self, job: SimulationJob, effect: str) -> str:
+        """Split a power simulation into one job per parameter setting."""
+        if job.outfile in self.merged:
+            return job.outfile
+        cell_files = []
+        for params in PARAMETERS[effect]:
+            parameter = parameter_argument(params)
+            cell = SimulationJob(
+                job.method,
+                job.options,
+                job.extra_args + " " + PARAMETER_FLAG + " " + parameter,
+                cell_filename(job.outfile, parameter),
+                job.engine)
+            cell_files.append(self.submit_sharded(cell) if self.shards > 1
+                              else self.add_job(cell))
+        self.merged[job.outfile] = cell_files
+
+        def merge() -> None:
+            merge_cell_files(cell_files, job.outfile)
+
+        self.add_task("merging " + job.outfile, merge, cell_files,
+                      [job.outfile])
+        return job.outfile
+
+    def submit_sharded(self, job: SimulationJob) -> str:
+        if job.outfile in self.merged:
+            return job.outfile
+        shard_files = []
+        for index in range(1, self.shards + 1):
+            shard = "--shard {}/{}".format(index, self.shards)
+            shard_files.append(self.add_job(SimulationJob(
+                job.method,
+                job.options,
+                job.extra_args + " " + shard,
+                shard_filename(job.outfile, index, self.shards),
+                job.engine)))
+        self.merged[job.outfile] = shard_files
+
+        def merge() -> None:
+            merge_shard_files(shard_files, job.outfile)
+
+        self.add_task("merging " + job.outfile, merge, shard_files,
+                      [job.outfile])
+        return job.outfile
+
+    def add_job(self, job: SimulationJob) -> str:
+        if job.outfile in self.jobs:
+            if self.jobs[job.outfile].command() != job.command():
+                raise ValueError(
+                    "conflicting simulation jobs for " + job.outfile)
+        else:
+            self.jobs[job.outfile] = job
+        return job.outfile
+
+    def add_task(
+        self,
+        name: str,
+        function: Callable[[], None],
+        dependencies: Iterable[str],
+        outputs: Iterable[str] = (),
+        sources: Iterable[str] = ()) -> None:
+
+        self.tasks.append(Task(name, function, list(dependencies),
+                               list(outputs), list(sources)))
+
+    def log(self, *args, **kwargs) -> None:
+        if self.monitor is not None:
+            self.monitor.log(*args, **kwargs)
+            return
+        with self._print_lock:
+            print(*args, **kwargs, flush=True)
+
+    def input_key(self, job: SimulationJob) -> str:
+        return self.inputs.key(job.command(), job.engine)
+
+    def record(self, job: SimulationJob, state: str) -> None:
+        if self.manifest is not None:
+            self.manifest.record(job.outfile, job.command(), state,
+                                 self.input_key(job))
+
+    def is_finished_before(self, job: SimulationJob) -> bool:
+        return (self.resume and self.manifest is not None
+                and self.manifest.is_finished(
+                    job.outfile, job.command(), self.input_key(job)))
+
+    def is_resumed(self, job: SimulationJob) -> bool:
+        if self.is_finished_before(job):
+            self.log("  skipping finished simulations for", job.outfile)
+            return True
+        return False
+
+    def is_cacheable(self, job: SimulationJob) -> bool:
+        return self.cache is not None and not self.profile and not (
+            self.save_p_values and not exists(p_values_dir(job.outfile)))
+
+    def run_job(self, job: SimulationJob) -> bool:
+        outdir = dirname(job.outfile)
+        if not exists(outdir) and outdir != "":
+            makedirs(outdir, exist_ok=True)
+        if self.is_resumed(job):
+            return True
+        if not self.is_cacheable(job):
+            success = self.execute(job)
+        else:
+            key = self.cache.key(job.command(), job.engine)
+            with self.cache.lock(key):
+                if self.cache.lookup(key, job.outfile):
+                    self.log("  reusing cached simulations for", job.outfile)
+                    success = True
+                else:
+                    success = self.execute(job)
+                    if success:
+                        self.cache.store(key, job.outfile)
+        self.record(job, STATE_FINISHED if success else STATE_FAILED)
+        return success
+
+    def run_fused(self, jobs: List[SimulationJob]) -> Dict[str, bool]:
+        """Run jobs as a fused simulation. Return success per outfile."""
+        results = {}
+        remaining = []
+        for job in jobs:
+            outdir = dirname(job.outfile)
+            if not exists(outdir) and outdir != "":
+                makedirs(outdir, exist_ok=True)
+            if self.is_resumed(job):
+                results[job.outfile] = True
+                continue
+            if self.is_cacheable(job):
+                key = self.cache.key(job.command(), job.engine)
+                with self.cache.lock(key):
+                    if self.cache.lookup(key, job.outfile):
+                        self.log("  reusing cached simulations for",
+                                 job.outfile)
+                        self.record(job, STATE_FINISHED)
+                        results[job.outfile] = True
+                        continue
+            remaining.append(job)
+        if len(remaining) == 1:
+            results[remaining[0].outfile] = self.run_job(remaining[0])
+        elif len(remaining) > 1:
+            fused, outfiles = fuse_jobs(remaining)
+            success = self.execute(fused)
+            if success:
+                split_fused_output(fused.outfile, outfiles)
+                remove(fused.outfile)
+                rmtree(p_values_dir(fused.outfile), ignore_errors=True)
+            for job in remaining:
+                if success and self.cache is not None:
+                    key = self.cache.key(job.command(), job.engine)
+                    with self.cache.lock(key):
+                        self.cache.store(key, job.outfile)
+                self.record(job, STATE_FINISHED if success else STATE_FAILED)
+                results[job.outfile] = success
+        return results
+
+    def execute(self, job: SimulationJob) -> bool:
+        if job.engine == ENGINE_NUMPY:
+            return self.execute_in_process(job)
+        tempfile = job.outfile + TEMP_SUFFIX
+        checkpoint = job.outfile + CHECKPOINT_SUFFIX
+        command = job.command() + ["--checkpoint", checkpoint,
+                                   "--checkpoint-key", self.input_key(job)]
+        if self.save_p_values:
+            command += ["--p-values", p_values_dir(job.outfile)]
+        if self.batch_size > 1:
+            command += ["--batch-size", str(self.batch_size)]
+        if self.profile:
+            command += ["--profile", job.outfile + PROFILE_SUFFIX]
+        progress = job.outfile + PROGRESS_SUFFIX
+        if self.monitor is not None:
+            if exists(progress):
+                remove(progress)
+            command += ["--progress", progress]
+        prefix = "  ## [" + job.outfile + "] "
+        self.log("  running simulations for", job.outfile, "...")
+        self.record(job, STATE_RUNNING)
+        if self.monitor is not None:
+            self.monitor.start(job.outfile, progress)
+        memory = None  # peak resident set size in megabytes
+        start = perf_counter()
+        if self.pool is not None:
+            def log(line: str) -> None:
+                self.log(prefix + line, end='')
+
+            success = self.pool.run_command(command, tempfile, log)
+        else:
+            with open(tempfile, "w") as out:
+                with Popen(
+                        command,
+                        stderr=PIPE,
+                        stdout=out,
+                        bufsize=1,  # line-buffered
+                        text=True) as p:
+                    for line in p.stderr:
+                        self.log(prefix + line, end='')
+                    # reap the process ourselves to get its resource usage
+                    _, status, usage = wait4(p.pid, 0)
+                    p.returncode = waitstatus_to_exitcode(status)
+                    memory = usage.ru_maxrss / 1024  # kilobytes on Linux
+            success = p.returncode == 0
+        seconds = perf_counter() - start
+        if success and self.history is not None:
+            self.history.record(self.runtime_arguments(job), seconds, memory)
+        if self.monitor is not None:
+            self.monitor.stop(job.outfile)
+            if exists(progress):
+                remove(progress)
+        if not success:
+            if exists(tempfile):
+                remove(tempfile)
+            return False
+        # atomic, replaces (but does not modify) a file linked to the cache
+        replace(tempfile, job.outfile)
+        rmtree(checkpoint, ignore_errors=True)
+        return True
+
+    def execute_in_process(self, job: SimulationJob) -> bool:
+        """Run a job of the NumPy engine in the calling thread."""
+        tempfile = job.outfile + TEMP_SUFFIX
+        arguments = job.arguments()
+        if self.save_p_values:
+            arguments += ["--p-values", p_values_dir(job.outfile)]
+        if self.batch_size > 1:
+            arguments += ["--batch-size", str(self.batch_size)]
+        prefix = "  ## [" + job.outfile + "] "
+
+        def log(line: str) -> None:
+            self.log(prefix + line)
+
+        self.log("  running simulations for", job.outfile, "(NumPy) ...")
+        self.record(job, STATE_RUNNING)
+        start = perf_counter()
+        try:
+            output = simulate(arguments, log)
+        except Exception as e:  # fail this job only, like a failed Rscript
+            log("Error: {}: {}".format(type(e).__name__, e))
+            return False
+        if self.history is not None:
+            self.history.record(self.runtime_arguments(job),
+                                perf_counter() - start)
+        with open(tempfile, "w") as f:
+            f.write(dumps(output, indent=2))
+        replace(tempfile, job.outfile)
+        return True
+
+    def runtime_arguments(self, job: SimulationJob) -> List[str]:
+        arguments = job.arguments()
+        if job.engine != ENGINE_R:
+            arguments += [ENGINE_FLAG, job.engine]
+        if self.batch_size > 1:
+            arguments += ["--batch-size", str(self.batch_size)]
+        return arguments
+
+    def predict(self, jobs: List[SimulationJob]) -> Prediction:
+        """Predict runtime and peak memory of a (fused) group of jobs."""
+        if self.history is None:
+            return Prediction(None, None)
+        if len(jobs) > 1:
+            fused, _ = fuse_jobs(jobs)
+            prediction = self.history.predict(self.runtime_arguments(fused))
+            if prediction.seconds is not None:
+                return prediction
+        predictions = [self.history.predict(self.runtime_arguments(job))
+                       for job in jobs]
+        seconds = [p.seconds for p in predictions]
+        memories = [p.memory for p in predictions if p.memory is not None]
+        return Prediction(
+            None if None in seconds else sum(seconds),
+            max(memories) if memories else None)
+
+    def needs_run(self, job: SimulationJob) -> bool:
+        """Whether a job is neither finished before nor cached."""
+        if self.is_finished_before(job):
+            return False
+        return not (self.is_cacheable(job) and self.cache.contains(
+            self.cache.key(job.command(), job.engine)))
+
+    def job_groups(self) -> List[List[SimulationJob]]:
+        groups: Dict[Tuple[str, ...], List[SimulationJob]] = {}
+        for outfile, job in self.jobs.items():
+            fusable = self.fuse and job.engine == ENGINE_R
+            key = fusion_key(job) if fusable else (outfile,)
+            groups.setdefault(key, []).append(job)
+        return list(groups.values())
+
+    def order(self, groups: List[List[SimulationJob]]) -> List[QueuedGroup]:
+        """Sort groups of jobs by their predicted runtime, longest first."""
+        def longest_first(item: QueuedGroup) -> float:
+            seconds = item[1].seconds
+            return -float("inf") if seconds is None else -seconds
+
+        return sorted([(jobs, self.predict(jobs)) for jobs in groups],
+                      key=longest_first)
+
+    def plan(self, workers: int) -> SchedulePlan:
+        """Predict the makespan of `run(workers)` from the history.
+
+        Jobs that are resumed or cached are not counted. Jobs without a
+        prediction are assumed to take the mean runtime of all others.
+        """
+        groups = []
+        for jobs in self.job_groups():
+            jobs = [job for job in jobs if self.needs_run(job)]
+            if len(jobs) > 0:
+                groups.append(jobs)
+        queue = self.order(groups)
+        known = [p.seconds for _, p in queue if p.seconds is not None]
+        mean = sum(known) / len(known) if known else 0.0
+        durations = [mean if p.seconds is None else p.seconds
+                     for _, p in queue]
+        memories = [p.memory or 0.0 for _, p in queue]
+        running: List[Tuple[float, float]] = []  # (end, memory)
+        now = 0.0
+        while durations:
+            while len(running) < workers:
+                index = next_admissible(
+                    memories, sum(m for _, m in running), len(running),
+                    self.memory_limit)
+                if index is None:
+                    break
+                running.append((now + durations.pop(index),
+                                memories.pop(index)))
+            running.sort()
+            now, _ = running.pop(0)
+        makespan = max([now] + [end for end, _ in running])
+        return SchedulePlan(makespan, len(queue), len(queue) - len(known))
+
+    def run(self, workers: int) -> List[str]:
+        """Run all jobs and tasks. Return the names of failed tasks.
+
+        A task that raises an exception fails (and tasks that depend on its
+        outputs are skipped) like a task whose simulations have failed; a
+        group of jobs that raises an exception fails as a whole. The other
+        jobs and tasks run nevertheless.
+        """
+        finished = set()
+        failed = set()
+        pending_tasks = list(self.tasks)
+        failed_tasks = []
+
+        scheduled = set(self.jobs)
+        for task in self.tasks:
+            scheduled.update(task.outputs)
+
+        def run_ready_tasks() -> None:
+            progress = True
+            while progress:  # tasks may depend on outputs of other tasks
+                progress = False
+                for task in list(pending_tasks):
+                    deps = set(task.dependencies) & scheduled
+                    if deps & failed:
+                        pending_tasks.remove(task)
+                        failed_tasks.append(task.name)
+                        failed.update(task.outputs)
+                        self.log("  skipping", task.name,
+                                 "due to failed simulations")
+                    elif deps <= finished:
+                        pending_tasks.remove(task)
+                        progress = True
+                        if is_up_to_date(task):
+                            self.log(" ", task.name, "is up to date")
+                        else:
+                            try:
+                                task.function()
+                            except Exception as e:  # e.g., a table writer
+                                failed_tasks.append(task.name)
+                                failed.update(task.outputs)
+                                self.log("  {} failed: {}: {}".format(
+                                    task.name, type(e).__name__, e))
+                                continue
+                        finished.update(task.outputs)
+
+        queue = self.order(self.job_groups())
+
+        def run_group(jobs: List[SimulationJob]) -> Dict[str, bool]:
+            try:
+                if len(jobs) == 1:
+                    return {jobs[0].outfile: self.run_job(jobs[0])}
+                return self.run_fused(jobs)
+            except Exception as e:  # e.g., splitting or caching the output
+                self.log("  simulations for {} raised {}: {}".format(
+                    ", ".join(job.outfile for job in jobs),
+                    type(e).__name__, e))
+                for job in jobs:
+                    self.record(job, STATE_FAILED)
+                return {job.outfile: False for job in jobs}
+
+        if self.monitor is not None:
+            self.monitor.expect(len(queue))
+        run_ready_tasks()  # tasks without (scheduled) dependencies
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures: Dict = {}  # future -> predicted memory
+
+            def admit() -> None:
+                while len(futures) < workers:
+                    index = next_admissible(
+                        [p.memory or 0.0 for _, p in queue],
+                        sum(futures.values()), len(futures),
+                        self.memory_limit)
+                    if index is None:
+                        return
+                    jobs, prediction = queue.pop(index)
+                    future = executor.submit(run_group, jobs)
+                    futures[future] = prediction.memory or 0.0
+
+            admit()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del futures[future]
+                    if self.monitor is not None:
+                        self.monitor.complete()
+                    for outfile, success in future.result().items():
+                        if success:
+                            finished.add(outfile)
+                        else:
+                            failed.add(outfile)
+                            self.log("  simulations for", outfile, "failed")
+                run_ready_tasks()
+                admit()
+        return failed_tasks
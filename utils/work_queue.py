@@ -0,0 +1,275 @@
+# work queue in a shared directory for running jobs on several machines
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, load, JSONDecodeError
+from os import getpid, listdir, makedirs, remove, rename, utime
+from os.path import exists, getmtime, join
+from socket import gethostname
+from subprocess import Popen, PIPE
+from threading import Event, Lock, Thread
+from time import monotonic, sleep, time_ns
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+
+# subdirectories of the queue directory
+DIR_PENDING = "pending"  # published jobs
+DIR_LEASED = "leased"  # jobs claimed by a worker (touched while running)
+DIR_DONE = "done"  # results
+DIR_LOGS = "logs"  # stderr of running jobs
+SPEC_SUFFIX = ".json"
+LOG_SUFFIX = ".log"
+TEMP_SUFFIX = ".tmp"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+DEFAULT_LEASE_TIMEOUT = 120.0  # seconds without a heartbeat
+HEARTBEAT_INTERVAL = 10.0  # seconds
+POLL_INTERVAL = 1.0  # seconds
+
+# last modification time of a lease and the (local, monotonic) time at
+# which it was first seen
+Heartbeat = Tuple[Optional[float], float]
+
+
+def write_atomically(filename: str, content: str) -> None:
+    """Write a file such that readers never see it incomplete."""
+    tempfile = filename + "." + uuid4().hex + TEMP_SUFFIX
+    with open(tempfile, "w") as f:
+        f.write(content)
+    rename(tempfile, filename)  # atomic, also on NFS
+
+
+def remove_if_exists(filename: str) -> None:
+    try:
+        remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def read_json(filename: str) -> Optional[Dict]:
+    try:
+        with open(filename, "r") as f:
+            return load(f)
+    except (FileNotFoundError, JSONDecodeError):
+        return None
+
+
+def make_queue_dirs(directory: str) -> None:
+    for subdir in (DIR_PENDING, DIR_LEASED, DIR_DONE, DIR_LOGS):
+        makedirs(join(directory, subdir), exist_ok=True)
+
+
+class WorkQueue:
+    """Publish jobs to a directory that workers on other machines share.
+
+    `run_command` writes the command line of a job to `pending/` and
+    blocks until a worker (see `serve`) has written its result to `done/`;
+    the stdout of the job is then written to the file `stdout`, as with
+    `WorkerPool.run_command`. A worker claims a job by moving it to
+    `leased/` and touches it while the job is running. A lease whose
+    modification time has not changed for `lease_timeout` seconds (as
+    measured by the coordinator, so clocks need not be synchronized) is
+    considered lost and moved back to `pending/`.
+
+    Workers run commands in their own working directory, which should be
+    a copy of this repository with the same relative paths. Files that a
+    job writes besides its stdout (checkpoints, p-values, progress and
+    profiles) are only visible to the coordinator if the repository is
+    shared as well (e.g., via NFS).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        lease_timeout=DEFAULT_LEASE_TIMEOUT,
+        poll_interval=POLL_INTERVAL) -> None:
+
+        self.directory = directory
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._published: Set[str] = set()
+        self._lock = Lock()
+        make_queue_dirs(directory)
+
+    def path(self, subdir: str, job_id: str, suffix=SPEC_SUFFIX) -> str:
+        return join(self.directory, subdir, job_id + suffix)
+
+    def publish(self, command: List[str]) -> str:
+        # job ids sort by publication time, so workers claim jobs in order
+        job_id = "{:020d}-{}".format(time_ns(), uuid4().hex[:8])
+        spec = {"id": job_id, "command": command}
+        with self._lock:
+            self._published.add(job_id)
+        write_atomically(self.path(DIR_PENDING, job_id), dumps(spec))
+        return job_id
+
+    def requeue_if_lost(self, job_id: str, heartbeat: Heartbeat) -> Heartbeat:
+        """Re-queue a lease without heartbeat. Return the new heartbeat."""
+        leased = self.path(DIR_LEASED, job_id)
+        try:
+            mtime = getmtime(leased)
+        except FileNotFoundError:  # not (or no longer) leased
+            return None, monotonic()
+        if mtime != heartbeat[0]:
+            return mtime, monotonic()
+        if monotonic() - heartbeat[1] < self.lease_timeout:
+            return heartbeat
+        try:
+            rename(leased, self.path(DIR_PENDING, job_id))
+        except FileNotFoundError:  # finished in the meantime
+            pass
+        return None, monotonic()
+
+    def wait(
+        self,
+        job_id: str,
+        log: Optional[Callable[[str], None]] = None) -> Dict:
+
+        """Wait for the result of a job, passing its stderr to `log`."""
+        done = self.path(DIR_DONE, job_id)
+        logfile = self.path(DIR_LOGS, job_id, LOG_SUFFIX)
+        heartbeat: Heartbeat = (None, monotonic())
+        offset = 0
+        while True:
+            result = read_json(done)
+            if log is not None and exists(logfile):
+                with open(logfile, "rb") as f:
+                    f.seek(offset)
+                    lines = f.readlines()
+                if len(lines) > 0 and not lines[-1].endswith(b"\n"):
+                    lines.pop()  # incomplete, read it next time
+                for line in lines:
+                    log(line.decode(errors="replace"))
+                    offset += len(line)
+            if result is not None:
+                return result
+            heartbeat = self.requeue_if_lost(job_id, heartbeat)
+            sleep(self.poll_interval)
+
+    def discard(self, job_id: str) -> None:
+        for subdir, suffix in ((DIR_PENDING, SPEC_SUFFIX),
+                               (DIR_LEASED, SPEC_SUFFIX),
+                               (DIR_DONE, SPEC_SUFFIX),
+                               (DIR_LOGS, LOG_SUFFIX)):
+            remove_if_exists(self.path(subdir, job_id, suffix))
+
+    def run_command(
+        self,
+        command: List[str],
+        stdout: str,
+        log: Optional[Callable[[str], None]] = None) -> bool:
+
+        """Run a command line on some worker, write its output to stdout."""
+        job_id = self.publish(command)
+        try:
+            result = self.wait(job_id, log)
+            with open(stdout, "w") as f:
+                f.write(result["stdout"])
+            return result["status"] == STATUS_OK
+        finally:
+            self.discard(job_id)  # incl. duplicates of re-queued jobs
+            with self._lock:
+                self._published.discard(job_id)
+
+    def close(self) -> None:
+        """Withdraw all jobs that have not finished."""
+        with self._lock:
+            job_ids, self._published = self._published, set()
+        for job_id in job_ids:
+            self.discard(job_id)
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def claim(directory: str) -> Optional[Dict]:
+    """Claim the oldest pending job (if any)."""
+    pending = join(directory, DIR_PENDING)
+    for name in sorted(listdir(pending)):
+        if not name.endswith(SPEC_SUFFIX):
+            continue
+        leased = join(directory, DIR_LEASED, name)
+        try:
+            rename(join(pending, name), leased)  # atomic: one worker wins
+        except FileNotFoundError:  # claimed by another worker
+            continue
+        utime(leased)  # the lease starts now
+        spec = read_json(leased)
+        if spec is not None:
+            return spec
+    return None
+
+
+def execute(directory: str, spec: Dict) -> None:
+    """Run a claimed job and publish its result."""
+    job_id = spec["id"]
+    leased = join(directory, DIR_LEASED, job_id + SPEC_SUFFIX)
+    logfile = join(directory, DIR_LOGS, job_id + LOG_SUFFIX)
+    finished = Event()
+
+    def keep_lease() -> None:
+        while not finished.wait(HEARTBEAT_INTERVAL):
+            try:
+                utime(leased)
+            except FileNotFoundError:  # re-queued by the coordinator
+                return
+
+    heartbeat = Thread(target=keep_lease, daemon=True)
+    heartbeat.start()
+    try:
+        with open(logfile, "a") as log:
+            p = Popen(spec["command"], stdout=PIPE, stderr=log, text=True)
+            stdout, _ = p.communicate()
+        status = STATUS_OK if p.returncode == 0 else STATUS_ERROR
+    except OSError as e:  # e.g., command not found
+        stdout, status = "", STATUS_ERROR
+        with open(logfile, "a") as log:
+            log.write(str(e) + "\n")
+    finally:
+        finished.set()
+        heartbeat.join()
+    if not exists(leased) and not exists(
+            join(directory, DIR_PENDING, job_id + SPEC_SUFFIX)):
+        remove_if_exists(logfile)  # withdrawn by the coordinator
+        return
+    result = {
+        "id": job_id,
+        "status": status,
+        "stdout": stdout,
+        "host": gethostname()
+    }
+    write_atomically(join(directory, DIR_DONE, job_id + SPEC_SUFFIX),
+                     dumps(result))
+    remove_if_exists(leased)
+
+
+def serve(
+    directory: str,
+    slots: int,
+    poll_interval=POLL_INTERVAL,
+    stop: Optional[Event] = None) -> None:
+
+    """Run jobs of a `WorkQueue` in `slots` parallel threads until stopped."""
+    make_queue_dirs(directory)
+    if stop is None:
+        stop = Event()
+    name = "{}:{}".format(gethostname(), getpid())
+
+    def work() -> None:
+        while not stop.is_set():
+            spec = claim(directory)
+            if spec is None:
+                stop.wait(poll_interval)
+                continue
+            print(name, "running", " ".join(spec["command"]), flush=True)
+            execute(directory, spec)
+
+    threads = [Thread(target=work, daemon=True) for _ in range(slots)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,153 @@
+# pool of persistent R processes (../ebstatmax/worker.R)
+# Copyright (C) 2022  Konstantin Emil Thiel
+
+from json import dumps, loads, JSONDecodeError
+from queue import Empty, Queue
+from subprocess import Popen, PIPE
+from threading import Event, Lock, Semaphore, Thread
+from typing import Callable, Iterable, List, Optional
+
+
+# worker program and protocol (see ../ebstatmax/worker.R)
+R_WORKER = ["Rscript", "./ebstatmax/worker.R"]
+END_OF_JOB = "\x1e"
+STATUS_OK = "ok"
+
+
+class RWorker:
+    """A long-lived R process that runs R scripts one at a time.
+
+    Loading R packages (optparse, devtools, dplyr, data.table, nparLD,
+    simUtils, ...) takes seconds, so a worker pays this cost once instead
+    of once per script. The stderr of a script is passed to the `log`
+    callback of the respective `run` call.
+    """
+
+    def __init__(self, command: Optional[List[str]] = None) -> None:
+        self.process = Popen(
+            command if command is not None else R_WORKER,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            bufsize=1,  # line-buffered
+            text=True)
+        self._log: Optional[Callable[[str], None]] = None
+        self._end_of_job = Event()
+        self._stderr_thread = Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _read_stderr(self) -> None:
+        try:
+            for line in self.process.stderr:
+                if line.rstrip("\n") == END_OF_JOB:
+                    self._end_of_job.set()
+                elif self._log is not None:
+                    self._log(line)
+        finally:
+            self._end_of_job.set()  # worker has terminated
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(
+        self,
+        script: str,
+        args: Iterable[str],
+        stdout: str,
+        log: Optional[Callable[[str], None]] = None) -> bool:
+
+        """Run script with args, write its output to the file stdout."""
+        self._log = log
+        self._end_of_job.clear()
+        request = {"script": script, "args": list(args), "stdout": stdout}
+        try:
+            self.process.stdin.write(dumps(request) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+            response = loads(line)
+        except (BrokenPipeError, JSONDecodeError):  # worker has died
+            self.close()
+            return False
+        finally:
+            self._end_of_job.wait()
+            self._log = None
+        return response["status"] == STATUS_OK
+
+    def close(self) -> None:
+        if self.process.stdin is not None and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()  # worker exits at end of input
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+
+
+class WorkerPool:
+    """Up to `size` R workers that are started on demand and kept warm.
+
+    `run` may be called from several threads; each call is served by an
+    idle worker. Workers that die (e.g., out of memory) are replaced.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        command: Optional[List[str]] = None) -> None:
+
+        self.command = command
+        self._idle: Queue = Queue()
+        self._available = Semaphore(size)
+        self._workers: List[RWorker] = []
+        self._lock = Lock()
+
+    def _acquire(self) -> RWorker:
+        self._available.acquire()
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            worker = RWorker(self.command)
+            with self._lock:
+                self._workers.append(worker)
+            return worker
+
+    def _release(self, worker: RWorker) -> None:
+        if worker.alive():
+            self._idle.put(worker)
+        else:
+            with self._lock:
+                self._workers.remove(worker)
+        self._available.release()
+
+    def run(
+        self,
+        script: str,
+        args: Iterable[str],
+        stdout: str,
+        log: Optional[Callable[[str], None]] = None) -> bool:
+
+        worker = self._acquire()
+        try:
+            return worker.run(script, args, stdout, log)
+        finally:
+            self._release(worker)
+
+    def run_command(
+        self,
+        command: List[str],
+        stdout: str,
+        log: Optional[Callable[[str], None]] = None) -> bool:
+
+        """Run an `Rscript <script> <args>` command line on the pool."""
+        return self.run(command[1], command[2:], stdout, log)
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -3,10 +3,26 @@
 
 from pylatex import Document, MultiColumn, Tabular, Table, Center
 from pylatex.utils import NoEscape, bold
-from typing import Iterable
+from typing import Iterable, List, Optional
 from pandas import DataFrame, isna
-from os import makedirs
-from os.path import exists, join
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from hashlib import sha256
+from os import makedirs, remove, replace
+from os.path import basename, exists, join, splitext
+from re import fullmatch
+from shutil import copy
+from subprocess import run, PIPE, STDOUT
+from tempfile import TemporaryDirectory
+
+
+# LaTeX compiler and files written to a result directory
+LATEX_COMPILER = ["pdflatex", "-interaction=nonstopmode", "-halt-on-error"]
+TABLE_PATTERN = r"table_(\d+)"
+COMBINED_NAME = "tables"
+HASH_SUFFIX = ".sha256"
+BEGIN_DOCUMENT = r"\begin{document}"
+END_DOCUMENT = r"\end{document}"
 
 
 def write_to_disc(
@@ -15,6 +31,8 @@ def write_to_disc(
     number: int,
     caption: str) -> None:
 
+    """Write a table to a .tex file; PDFs are created by `render_tables`."""
+
     table = Table()
     table.append(NoEscape(r"\small"))
     table.add_caption(NoEscape(caption))
@@ -28,7 +46,125 @@ def write_to_disc(
     if not exists(result_directory) and result_directory != "":
         makedirs(result_directory)
     result_filename = join(result_directory, "table_" + str(number))
-    doc.generate_pdf(result_filename, clean_tex=False)
+    doc.generate_tex(result_filename)
+
+
+def content_hash(filename: str) -> str:
+    with open(filename, "rb") as f:
+        return sha256(f.read()).hexdigest()
+
+
+def is_up_to_date(tex_file: str) -> bool:
+    """Whether the PDF of tex_file was compiled from its current content."""
+    name = splitext(tex_file)[0]
+    if not exists(name + ".pdf") or not exists(name + HASH_SUFFIX):
+        return False
+    with open(name + HASH_SUFFIX, "r") as f:
+        return f.read().strip() == content_hash(tex_file)
+
+
+def compile_tex(tex_file: str) -> Optional[str]:
+    """Compile tex_file in a temporary directory. Return the log on failure.
+
+    The PDF replaces the one next to tex_file only if compilation succeeds,
+    and the hash of the compiled content is recorded next to it.
+    """
+    name = splitext(tex_file)[0]
+    tex_hash = content_hash(tex_file)
+    with TemporaryDirectory() as directory:
+        copy(tex_file, directory)
+        try:
+            p = run(LATEX_COMPILER + [basename(tex_file)], cwd=directory,
+                    stdout=PIPE, stderr=STDOUT, text=True)
+        except FileNotFoundError as e:  # compiler not installed
+            return str(e)
+        pdf_file = join(directory, basename(name) + ".pdf")
+        if p.returncode != 0 or not exists(pdf_file):
+            return p.stdout
+        copy(pdf_file, name + ".pdf.tmp")  # temp dir may be on another disk
+        replace(name + ".pdf.tmp", name + ".pdf")
+    with open(name + HASH_SUFFIX, "w") as f:
+        f.write(tex_hash + "\n")
+    return None
+
+
+def combine_tex_files(tex_files: Iterable[str], filename: str) -> None:
+    """Write the tables of several .tex files into one document.
+
+    The preamble is taken from the first file (all tables share it). Each
+    table sets its own number, so the numbering is kept.
+    """
+    bodies = []
+    preamble = None
+    for tex_file in tex_files:
+        with open(tex_file, "r") as f:
+            content = f.read()
+        begin = content.index(BEGIN_DOCUMENT)
+        end = content.rindex(END_DOCUMENT)
+        if preamble is None:
+            preamble = content[:begin]
+        bodies.append(content[begin + len(BEGIN_DOCUMENT):end].strip())
+    content = preamble + BEGIN_DOCUMENT + "\n" + \
+        "\n\\clearpage\n".join(bodies) + "\n" + END_DOCUMENT + "\n"
+    if exists(filename):
+        with open(filename, "r") as f:
+            if f.read() == content:
+                return  # keep the hash of an unchanged document valid
+    with open(filename, "w") as f:
+        f.write(content)
+
+
+def table_files(result_directory: str) -> List[str]:
+    """The .tex files of all tables in result_directory, ordered by number."""
+    tex_files = []
+    for tex_file in glob(join(result_directory, "*.tex")):
+        match = fullmatch(TABLE_PATTERN, splitext(basename(tex_file))[0])
+        if match is not None:
+            tex_files.append((int(match.group(1)), tex_file))
+    return [tex_file for _, tex_file in sorted(tex_files)]
+
+
+def remove_orphaned_pdfs(result_directory: str) -> None:
+    """Remove table PDFs (and hashes) whose .tex file no longer exists."""
+    for pdf_file in glob(join(result_directory, "*.pdf")):
+        name = splitext(pdf_file)[0]
+        if fullmatch(TABLE_PATTERN, basename(name)) and \
+                not exists(name + ".tex"):
+            remove(pdf_file)
+            if exists(name + HASH_SUFFIX):
+                remove(name + HASH_SUFFIX)
+
+
+def render_tables(
+    result_directory: str,
+    workers: int = 1,
+    combined=False) -> List[str]:
+
+    """Compile the .tex files of all tables in result_directory to PDFs.
+
+    Tables whose PDF stems from the same content (cf. `is_up_to_date`) are
+    skipped, the others are compiled concurrently by `workers` compiler
+    processes in separate temporary directories. With `combined=True`,
+    all tables are additionally compiled into a single document. Return
+    the names of the .tex files that could not be compiled.
+    """
+    remove_orphaned_pdfs(result_directory)
+    tex_files = table_files(result_directory)
+    if combined and len(tex_files) > 0:
+        combined_file = join(result_directory, COMBINED_NAME + ".tex")
+        combine_tex_files(tex_files, combined_file)
+        tex_files.append(combined_file)
+    outdated = [tex_file for tex_file in tex_files
+                if not is_up_to_date(tex_file)]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        logs = list(executor.map(compile_tex, outdated))
+    failed = []
+    for tex_file, log in zip(outdated, logs):
+        if log is not None:
+            print("could not compile", tex_file, "- the LaTeX log reads:")
+            print(log)
+            failed.append(basename(tex_file))
+    return failed
 
 
 def fill_power_table_segment(